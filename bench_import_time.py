@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check.
+
+Imports each module in a fresh interpreter with `-X importtime` and compares
+its cumulative import time with a budget. Exits non-zero when a module goes
+over, so a heavy top-level import (torch, chromadb, openai, ...) is caught
+before it reaches every CLI call and git hook.
+
+    python bench_import_time.py [--runs 5]
+"""
+import sys
+import argparse
+import subprocess
+
+# Best-of-N cumulative import time, in milliseconds.
+BUDGETS_MS = {
+    "oracle_cli": 50,
+    "codebase_context_oracle": 150,
+}
+
+def import_ms(module: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    ).stderr
+    for line in reversed(out.splitlines()):
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"no importtime entry for {module}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    over = False
+    for module, budget in BUDGETS_MS.items():
+        best = min(import_ms(module) for _ in range(args.runs))
+        ok = best <= budget
+        over |= not ok
+        print(f"{'✅' if ok else '❌'} {module:<26} {best:8.1f} ms  (budget {budget} ms)")
+    sys.exit(1 if over else 0)
+
+if __name__ == "__main__":
+    main()
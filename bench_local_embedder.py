@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Local embedder benchmark: SentenceTransformer on torch vs the int8 ONNX backend.
+
+Embeds the same code windows with both backends and reports throughput and how
+far the ONNX vectors drift from torch (cosine similarity per text).
+
+    python bench_local_embedder.py [--root .] [--n 2000] [--threads 4] [--batch-size 64]
+"""
+import os
+import time
+import argparse
+
+from codebase_context_oracle import IgnoreRules, OnnxEmbedder
+
+def sample_texts(root: str, n: int, window: int = 40):
+    texts = []
+    for rel in IgnoreRules(root).walk():
+        if not rel.endswith((".py", ".rs", ".go", ".ts", ".js", ".java", ".c", ".cpp", ".cs")):
+            continue
+        try:
+            lines = open(os.path.join(root, rel), encoding="utf-8", errors="ignore").read().splitlines()
+        except OSError:
+            continue
+        for i in range(0, len(lines), window):
+            texts.append("\n".join(lines[i:i + window]))
+            if len(texts) >= n:
+                return texts
+    return texts
+
+def timed(label: str, encode, texts):
+    encode(texts[:8])
+    started = time.perf_counter()
+    vectors = encode(texts)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<6} {len(texts) / elapsed:9.1f} texts/s  ({elapsed:.2f}s)")
+    return vectors
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default=".")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--file-name", default=None, help="ONNX file under onnx/ (default: int8 build for this CPU)")
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    texts = sample_texts(args.root, args.n)
+    print(f"📏 {len(texts)} code windows from {os.path.abspath(args.root)}")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    st = SentenceTransformer(args.model, device="cpu")
+    onnx = OnnxEmbedder(args.model, args.threads, args.batch_size, args.file_name)
+    a = timed("torch", lambda t: st.encode(t, batch_size=args.batch_size), texts)
+    b = timed("onnx", onnx.encode, texts)
+    cos = (a * b).sum(axis=1)
+    print(f"cosine(torch, onnx): min {cos.min():.4f} • mean {cos.mean():.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -3,54 +3,1978 @@
 CodebaseContextOracle - Memory-Aware, OpenAI-powered, multi-language
 """
 import os
+import sys
+import platform
 import json
+import fnmatch
+import ctypes
+import ctypes.util
+import fcntl
+import hashlib
+import queue
+import random
+import re
+import select
+import socket
+import socketserver
+import sqlite3
+import struct
+import subprocess
+import threading
+import time
+import uuid
+from array import array
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-import chromadb
-import networkx as nx
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
-from tree_sitter_language_pack import get_parser
+
+# chromadb, networkx, openai, sentence_transformers and tree_sitter are imported
+# where first needed, so importing this module (CLI, hooks, server boot) stays cheap.
+
+class IgnoreRules:
+    """.gitignore-style path filter for a tree.
+
+    Honors .git/info/exclude plus .gitignore and .oracleignore files in any
+    directory, and always skips hidden entries and PRUNE_DIRS.
+    """
+    PRUNE_DIRS = frozenset({"node_modules", "target", "build", "dist", "venv", "__pycache__"})
+    IGNORE_FILES = (".gitignore", ".oracleignore")
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._base = self._parse(root / ".git" / "info" / "exclude", "")
+        self._dir_rules = {}
+
+    @staticmethod
+    def _translate(pattern: str) -> str:
+        out, i = [], 0
+        while i < len(pattern):
+            c = pattern[i]
+            if pattern.startswith("**/", i):
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            if c == "*":
+                out.append("[^/]*")
+            elif c == "?":
+                out.append("[^/]")
+            elif c == "[":
+                end = pattern.find("]", i + 2)
+                if end == -1:
+                    out.append(re.escape(c))
+                else:
+                    body = pattern[i + 1:end]
+                    if body.startswith("!"):
+                        body = "^" + body[1:]
+                    out.append(f"[{body}]")
+                    i = end
+            elif c == "\\" and i + 1 < len(pattern):
+                i += 1
+                out.append(re.escape(pattern[i]))
+            else:
+                out.append(re.escape(c))
+            i += 1
+        return "".join(out)
+
+    def _parse(self, path: Path, base: str):
+        try:
+            lines = path.read_text(encoding="utf-8", errors="ignore").splitlines()
+        except OSError:
+            return []
+        rules = []
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            body = self._translate(line.lstrip("/"))
+            regex = re.compile(("^" if anchored else "^(?:.*/)?") + body + "$")
+            rules.append((base, regex, negate, dir_only))
+        return rules
+
+    def rules_for(self, rel_dir: str):
+        """Rules in effect for entries of `rel_dir` (root is "")."""
+        rules = self._dir_rules.get(rel_dir)
+        if rules is None:
+            parent = self.rules_for(rel_dir.rpartition("/")[0]) if rel_dir else self._base
+            own = []
+            for name in self.IGNORE_FILES:
+                own += self._parse(self.root / rel_dir / name, rel_dir)
+            rules = self._dir_rules[rel_dir] = parent + own if own else parent
+        return rules
+
+    def excluded(self, rel: str, is_dir: bool) -> bool:
+        """Whether this entry itself is excluded (its parent directories are not checked)."""
+        parent, _, name = rel.rpartition("/")
+        if name.startswith(".") or (is_dir and name in self.PRUNE_DIRS):
+            return True
+        result = False
+        for base, regex, negate, dir_only in self.rules_for(parent):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel[len(base) + 1:] if base else rel):
+                result = not negate
+        return result
+
+    def ignored(self, rel: str) -> bool:
+        """Whether a file path is excluded, either directly or through an excluded parent directory."""
+        parts = rel.split("/")
+        for i in range(1, len(parts)):
+            if self.excluded("/".join(parts[:i]), True):
+                return True
+        return self.excluded(rel, False)
+
+    def walk(self, start: str = ""):
+        """Stream relative paths of non-ignored files, pruning excluded directories before descending."""
+        stack = [start]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                with os.scandir(self.root / rel_dir) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            subdirs = []
+            for entry in entries:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self.excluded(rel, True):
+                            subdirs.append(rel)
+                    elif entry.is_file() and not self.excluded(rel, False):
+                        yield rel
+                except OSError:
+                    continue
+            stack.extend(reversed(subdirs))
+
+class FileFilter:
+    """Cheap classification before a file is read in full.
+
+    Oversized, denylisted, binary (NUL byte in the first SNIFF_BYTES), minified
+    and generated files are skipped; skip() returns the reason or None.
+    """
+    SNIFF_BYTES = 8192
+    DEFAULT_SKIP_GLOBS = (
+        "*.lock", "package-lock.json", "pnpm-lock.yaml", "go.sum", "*.min.js", "*.min.css", "*.map",
+        "*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico", "*.webp", "*.pdf", "*.zip", "*.gz", "*.tar",
+        "*.jar", "*.so", "*.dll", "*.dylib", "*.exe", "*.o", "*.a", "*.pyc", "*.class", "*.wasm",
+        "*.woff", "*.woff2", "*.ttf", "*.mp3", "*.mp4", "*.sqlite3", "*.db", "*.pb.go", "*_pb2.py",
+    )
+    GENERATED_MARKERS = (b"@generated", b"DO NOT EDIT", b"Code generated by", b"<auto-generated")
+
+    def __init__(self, max_bytes: int = 2_000_000, skip_globs=()):
+        self.max_bytes = max_bytes
+        self.skip_globs = self.DEFAULT_SKIP_GLOBS + tuple(skip_globs)
+
+    def skip_by_name(self, rel_path: str, size: int):
+        name = rel_path.rpartition("/")[2]
+        if any(fnmatch.fnmatch(name, g) or fnmatch.fnmatch(rel_path, g) for g in self.skip_globs):
+            return "denylisted"
+        if size > self.max_bytes:
+            return "oversized"
+        return None
+
+    def skip_by_head(self, head: bytes):
+        if b"\0" in head:
+            return "binary"
+        lines = head.split(b"\n")
+        if len(head) >= 4096 and (max(map(len, lines)) > 4000 or len(head) / len(lines) > 300):
+            return "minified"
+        if any(marker in head[:2048] for marker in self.GENERATED_MARKERS):
+            return "generated"
+        return None
+
+def _query_matches(query, node):
+    """(pattern_index, {capture: [nodes]}) for every match, across py-tree-sitter API versions."""
+    try:
+        from tree_sitter import QueryCursor
+    except ImportError:
+        matches = query.matches(node)
+    else:
+        matches = QueryCursor(query).matches(node)
+    for index, captures in matches:
+        yield index, {k: v if isinstance(v, list) else [v] for k, v in captures.items()}
+
+class ASTChunker:
+    """Turns a tree-sitter tree into chunks of roughly `max_tokens`.
+
+    Definitions are found with a precompiled per-language query (QUERIES)
+    capturing each definition as @function or @container and its name as
+    @name, all in one native pass. Languages without a query fall back to an
+    iterative scan of node types.
+
+    Definitions larger than the window are split at child boundaries; runs of
+    adjacent sibling definitions smaller than `min_tokens` are packed into one
+    chunk. Token counts are estimated at ~4 bytes per token.
+
+    In hierarchical mode (the default) each container (class, struct, impl,
+    trait, ...) yields one skeleton chunk — its header, fields and member
+    signatures — and every member is chunked exactly once, with a `parent`
+    link to the container's symbol path. Flat mode emits every definition
+    whole, so members also appear inside their container's chunk.
+    """
+    QUERIES = {
+        "python": """
+            (function_definition name: (identifier) @name) @function
+            (class_definition name: (identifier) @name) @container
+        """,
+        "rust": """
+            (function_item name: (identifier) @name) @function
+            (function_signature_item name: (identifier) @name) @function
+            (macro_definition name: (identifier) @name) @function
+            (struct_item name: (type_identifier) @name) @container
+            (enum_item name: (type_identifier) @name) @container
+            (union_item name: (type_identifier) @name) @container
+            (trait_item name: (type_identifier) @name) @container
+            (impl_item type: (_) @name) @container
+            (mod_item name: (identifier) @name body: (_)) @container
+        """,
+        "go": """
+            (function_declaration name: (identifier) @name) @function
+            (method_declaration name: (field_identifier) @name) @function
+            (type_declaration (type_spec name: (type_identifier) @name type: [(struct_type) (interface_type)])) @container
+        """,
+        "csharp": """
+            (method_declaration name: (identifier) @name) @function
+            (constructor_declaration name: (identifier) @name) @function
+            (local_function_statement name: (identifier) @name) @function
+            (class_declaration name: (identifier) @name) @container
+            (struct_declaration name: (identifier) @name) @container
+            (interface_declaration name: (identifier) @name) @container
+            (enum_declaration name: (identifier) @name) @container
+            (record_declaration name: (identifier) @name) @container
+            (namespace_declaration name: (_) @name) @container
+        """,
+        "c": """
+            (function_definition declarator: (function_declarator declarator: (_) @name)) @function
+            (function_definition declarator: (pointer_declarator declarator: (function_declarator declarator: (_) @name))) @function
+            (struct_specifier name: (type_identifier) @name body: (_)) @container
+            (union_specifier name: (type_identifier) @name body: (_)) @container
+            (enum_specifier name: (type_identifier) @name body: (_)) @container
+        """,
+        "cpp": """
+            (function_definition declarator: (function_declarator declarator: (_) @name)) @function
+            (function_definition declarator: (pointer_declarator declarator: (function_declarator declarator: (_) @name))) @function
+            (function_definition declarator: (reference_declarator (function_declarator declarator: (_) @name))) @function
+            (class_specifier name: (_) @name body: (_)) @container
+            (struct_specifier name: (_) @name body: (_)) @container
+            (union_specifier name: (_) @name body: (_)) @container
+            (enum_specifier name: (_) @name body: (_)) @container
+            (namespace_definition name: (_) @name) @container
+        """,
+        "java": """
+            (method_declaration name: (identifier) @name) @function
+            (constructor_declaration name: (identifier) @name) @function
+            (class_declaration name: (identifier) @name) @container
+            (interface_declaration name: (identifier) @name) @container
+            (enum_declaration name: (identifier) @name) @container
+            (record_declaration name: (identifier) @name) @container
+            (annotation_type_declaration name: (identifier) @name) @container
+        """,
+        "javascript": """
+            (function_declaration name: (identifier) @name) @function
+            (generator_function_declaration name: (identifier) @name) @function
+            (method_definition name: (_) @name) @function
+            (lexical_declaration (variable_declarator name: (identifier) @name value: [(arrow_function) (function_expression)])) @function
+            (variable_declaration (variable_declarator name: (identifier) @name value: [(arrow_function) (function_expression)])) @function
+            (class_declaration name: (identifier) @name) @container
+        """,
+        "typescript": """
+            (function_declaration name: (identifier) @name) @function
+            (generator_function_declaration name: (identifier) @name) @function
+            (method_definition name: (_) @name) @function
+            (lexical_declaration (variable_declarator name: (identifier) @name value: [(arrow_function) (function_expression)])) @function
+            (variable_declaration (variable_declarator name: (identifier) @name value: [(arrow_function) (function_expression)])) @function
+            (class_declaration name: (type_identifier) @name) @container
+            (abstract_class_declaration name: (type_identifier) @name) @container
+            (interface_declaration name: (type_identifier) @name) @container
+            (enum_declaration name: (identifier) @name) @container
+            (internal_module name: (_) @name) @container
+        """,
+    }
+    DEFINITION_KEYWORDS = frozenset({
+        "function", "method", "class", "struct", "enum", "trait", "impl",
+        "interface", "record", "namespace"
+    })
+    CONTAINER_KEYWORDS = frozenset({"class", "struct", "enum", "trait", "impl", "interface", "record", "namespace"})
+    DEFINITION_SUFFIXES = frozenset({"definition", "declaration", "item", "specifier"})
+    MIN_CHARS = 50
+
+    def __init__(self, max_tokens: int = 800, min_tokens: int = 100, hierarchical: bool = True,
+                 queries=None):
+        self.max_tokens = max(16, max_tokens)
+        self.min_tokens = min(min_tokens, self.max_tokens)
+        self.hierarchical = hierarchical
+        self.queries = {**self.QUERIES, **(queries or {})}
+
+    def compile_query(self, lang_id: str):
+        """Compiled definition query for a language, or None to use the generic node-type scan."""
+        source = self.queries.get(lang_id)
+        if not source:
+            return None
+        from tree_sitter import Query
+        from tree_sitter_language_pack import get_language
+        return Query(get_language(lang_id), source)
+
+    @staticmethod
+    def tokens(n_bytes: int) -> int:
+        return n_bytes // 4 + 1
+
+    def is_definition(self, node) -> bool:
+        words = node.type.split("_")
+        return words[-1] in self.DEFINITION_SUFFIXES and not self.DEFINITION_KEYWORDS.isdisjoint(words)
+
+    def is_container(self, node) -> bool:
+        return not self.CONTAINER_KEYWORDS.isdisjoint(node.type.split("_"))
+
+    @staticmethod
+    def symbol_of(node, src: bytes):
+        name_node = node.child_by_field_name("name") or node.child_by_field_name("identifier")
+        return src[name_node.start_byte:name_node.end_byte].decode("utf-8", errors="ignore") if name_node else None
+
+    def definitions(self, tree, src: bytes, query=None):
+        """(node, symbol, is_container) for every definition, outer definitions before inner ones."""
+        if query is None:
+            found, stack = [], [tree.root_node]
+            while stack:
+                node = stack.pop()
+                if self.is_definition(node):
+                    found.append((node, self.symbol_of(node, src), self.is_container(node)))
+                stack.extend(reversed(node.children))
+            return found
+        found = {}
+        for _, captures in _query_matches(query, tree.root_node):
+            for kind in ("container", "function"):
+                if kind in captures:
+                    node = captures[kind][0]
+                    name = captures.get("name")
+                    symbol = src[name[0].start_byte:name[0].end_byte].decode("utf-8", errors="ignore") if name else None
+                    found.setdefault((node.start_byte, node.end_byte), (node, symbol, kind == "container"))
+        return [found[key] for key in sorted(found, key=lambda k: (k[0], -k[1]))]
+
+    def extract(self, tree, content: str, query=None):
+        src = content.encode("utf-8")
+        roots, open_defs = [], []
+        for node, symbol, container in self.definitions(tree, src, query):
+            while open_defs and node.start_byte >= open_defs[-1]["node"].end_byte:
+                open_defs.pop()
+            entry = {"node": node, "symbol": symbol, "container": container, "children": []}
+            (open_defs[-1]["children"] if open_defs else roots).append(entry)
+            open_defs.append(entry)
+
+        chunks = []
+        work = deque([(roots, (), None)])
+        while work:
+            siblings, scope, parent = work.popleft()
+            run = []
+            for entry in siblings:
+                node, symbol = entry["node"], entry["symbol"]
+                path = scope + (symbol or node.type,)
+                if self.hierarchical and entry["container"]:
+                    self._flush_run(run, src, scope, chunks, parent)
+                    self._emit_skeleton(entry, path, src, chunks, parent)
+                    work.append((entry["children"], path, ".".join(path)))
+                    continue
+                if self.tokens(node.end_byte - node.start_byte) < self.min_tokens:
+                    if run and self.tokens(node.end_byte - run[0][0].start_byte) > self.max_tokens:
+                        self._flush_run(run, src, scope, chunks, parent)
+                    run.append((node, symbol, path))
+                else:
+                    self._flush_run(run, src, scope, chunks, parent)
+                    self._emit(node, symbol, path, src, chunks, parent)
+                if not self.hierarchical:
+                    work.append((entry["children"], path, parent))
+            self._flush_run(run, src, scope, chunks, parent)
+        return chunks
+
+    def _skeleton(self, entry, src: bytes) -> str:
+        """Container text with every member definition reduced to its signature."""
+        node = entry["node"]
+        pieces, pos = [], node.start_byte
+        for child in entry["children"]:
+            member = child["node"]
+            body = member.child_by_field_name("body")
+            if body is not None:
+                cut = body.start_byte
+            else:
+                cut = src.find(b"\n", member.start_byte, member.end_byte)
+                if cut == -1:
+                    continue
+            pieces.append(src[pos:cut].rstrip())
+            pieces.append(b" ...")
+            pos = member.end_byte
+        pieces.append(src[pos:node.end_byte])
+        return b"".join(pieces).decode("utf-8", errors="ignore").strip()
+
+    def _emit_skeleton(self, entry, path: tuple, src: bytes, chunks: list, parent):
+        node = entry["node"]
+        text = self._skeleton(entry, src)
+        if len(text) <= self.MIN_CHARS:
+            return
+        lines = text.split("\n")
+        windows, current = [], []
+        for line in lines:
+            if current and self.tokens(len("\n".join(current + [line]).encode("utf-8"))) > self.max_tokens:
+                windows.append(current)
+                current = []
+            current.append(line)
+        windows.append(current)
+        for part, window in enumerate(windows, 1):
+            chunk = {
+                "text": "\n".join(window),
+                "symbol": entry["symbol"],
+                "symbol_path": ".".join(path),
+                "kind": node.type,
+                "skeleton": True,
+                "parent": parent,
+                "start_line": node.start_point[0] + 1,
+                "end_line": node.end_point[0] + 1
+            }
+            if len(windows) > 1:
+                chunk["part"] = part
+            chunks.append(chunk)
+
+    def _flush_run(self, run: list, src: bytes, scope: tuple, chunks: list, parent):
+        """Emit pending small sibling definitions, packed together when there is more than one."""
+        if not run:
+            return
+        if len(run) == 1:
+            node, symbol, path = run[0]
+            self._emit(node, symbol, path, src, chunks, parent)
+        else:
+            text = "\n\n".join(src[n.start_byte:n.end_byte].decode("utf-8", errors="ignore").strip()
+                               for n, _, _ in run)
+            if len(text) > self.MIN_CHARS:
+                names = [symbol or node.type for node, symbol, _ in run]
+                chunks.append({
+                    "text": text,
+                    "symbol": ", ".join(names),
+                    "symbol_path": ".".join(scope + ("+".join(names),)),
+                    "kind": "group",
+                    "parent": parent,
+                    "start_line": run[0][0].start_point[0] + 1,
+                    "end_line": run[-1][0].end_point[0] + 1
+                })
+        run.clear()
+
+    def _emit(self, node, symbol, path: tuple, src: bytes, chunks: list, parent):
+        windows = self._pack(self._spans(node, src), src)
+        for part, (start, end, first_row, last_row) in enumerate(windows, 1):
+            text = src[start:end].decode("utf-8", errors="ignore").strip()
+            if len(text) <= self.MIN_CHARS:
+                continue
+            chunk = {
+                "text": text,
+                "symbol": symbol,
+                "symbol_path": ".".join(path),
+                "kind": node.type,
+                "parent": parent,
+                "start_line": first_row + 1,
+                "end_line": last_row + 1
+            }
+            if len(windows) > 1:
+                chunk["part"] = part
+            chunks.append(chunk)
+
+    def _spans(self, node, src: bytes):
+        """(start_byte, end_byte, start_row, end_row) pieces of `node`, each within the token window."""
+        spans, stack = [], [node]
+        while stack:
+            n = stack.pop()
+            if self.tokens(n.end_byte - n.start_byte) <= self.max_tokens:
+                spans.append((n.start_byte, n.end_byte, n.start_point[0], n.end_point[0]))
+            elif not n.children:
+                spans.extend(self._line_spans(n.start_byte, n.end_byte, n.start_point[0], src))
+            else:
+                stack.extend(reversed(n.children))
+        return spans
+
+    def _line_spans(self, start: int, end: int, row: int, src: bytes):
+        """Split an oversized leaf (e.g. a huge literal) on line boundaries."""
+        spans = []
+        pos = start
+        while pos < end:
+            cut = pos
+            stop_row = row
+            while cut < end:
+                nl = src.find(b"\n", cut, end)
+                nxt = end if nl == -1 else nl + 1
+                if cut > pos and self.tokens(nxt - pos) > self.max_tokens:
+                    break
+                cut = nxt
+                if nl != -1 and cut < end:
+                    stop_row += 1
+            spans.append((pos, cut, row, stop_row))
+            row = stop_row
+            pos = cut
+        return spans
+
+    def _pack(self, spans, src: bytes):
+        """Greedily merge consecutive spans into windows of at most max_tokens."""
+        windows = []
+        for start, end, first_row, last_row in spans:
+            if windows and self.tokens(end - windows[-1][0]) <= self.max_tokens:
+                windows[-1] = (windows[-1][0], end, windows[-1][2], last_row)
+            else:
+                windows.append((start, end, first_row, last_row))
+        return windows
+
+class ParseCache:
+    """Bounded LRU of recent parse trees keyed by path, for incremental reparsing.
+
+    parse() diffs the new source against the cached one, applies the edit to
+    the old tree and lets tree-sitter reuse every subtree outside it.
+    """
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.incremental = 0
+        self.full = 0
+
+    @staticmethod
+    def _common_prefix(a: bytes, b: bytes, limit: int) -> int:
+        lo, hi = 0, limit
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if a[:mid] == b[:mid]:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    @staticmethod
+    def _common_suffix(a: bytes, b: bytes, limit: int) -> int:
+        lo, hi = 0, limit
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if a[len(a) - mid:] == b[len(b) - mid:]:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    @staticmethod
+    def _point(src: bytes, offset: int):
+        row = src.count(b"\n", 0, offset)
+        return row, offset - (src.rfind(b"\n", 0, offset) + 1)
+
+    def parse(self, key: str, lang_id: str, parser, src: bytes):
+        cached = self.entries.pop(key, None)
+        tree = None
+        if cached is not None and cached[0] == lang_id:
+            _, old_src, old_tree = cached
+            if old_src == src:
+                tree = old_tree
+            else:
+                start = self._common_prefix(old_src, src, min(len(old_src), len(src)))
+                end = self._common_suffix(old_src, src, min(len(old_src), len(src)) - start)
+                old_end, new_end = len(old_src) - end, len(src) - end
+                old_tree.edit(start_byte=start, old_end_byte=old_end, new_end_byte=new_end,
+                              start_point=self._point(src, start), old_end_point=self._point(old_src, old_end),
+                              new_end_point=self._point(src, new_end))
+                tree = parser.parse(src, old_tree)
+                self.incremental += 1
+        if tree is None:
+            tree = parser.parse(src)
+            self.full += 1
+        self.entries[key] = (lang_id, src, tree)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return tree
+
+    def discard(self, key: str):
+        self.entries.pop(key, None)
+
+class EmbeddingCache:
+    """Content-addressed on-disk embedding cache (SQLite) with size-bounded LRU eviction."""
+    BATCH = 500
+
+    def __init__(self, path, max_entries: int = 500_000):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        found = {}
+        now = time.time_ns()
+        with self.lock:
+            for i in range(0, len(keys), self.BATCH):
+                batch = keys[i:i + self.BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    hit = [key for key, _ in rows]
+                    self.conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(hit))})",
+                        [now, *hit]
+                    )
+            self.conn.commit()
+        return found
+
+    def put_many(self, items):
+        now = time.time_ns()
+        with self.lock:
+            cur = self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items]
+            )
+            self.size += max(cur.rowcount, 0)
+            if self.size > self.max_entries:
+                excess = self.size - self.max_entries
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self.size -= excess
+            self.conn.commit()
+
+class FileStateStore:
+    """Per-file index state (mtime, size, hash, skip reason) in SQLite, keyed by relative path.
+
+    Reads and writes look like a dict. Writes are buffered until commit(), which
+    applies them in one transaction, so the store only ever moves from one
+    checkpoint to the next.
+    """
+    COLUMNS = ("mtime", "size", "hash", "skipped", "last_indexed")
+
+    def __init__(self, path):
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime REAL, size INTEGER,"
+            " hash TEXT, skipped TEXT, last_indexed TEXT) WITHOUT ROWID"
+        )
+        self.conn.commit()
+        self.pending = {}
+
+    def migrate_json(self, json_path: Path):
+        """One-time import of a legacy metadata.json; the file is kept as metadata.json.migrated.
+
+        A file that vanishes midway was migrated by another process.
+        """
+        if not json_path.exists():
+            return
+        try:
+            legacy = json.loads(json_path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not migrate {json_path.name}: {e}")
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                [(rel, *(entry.get(c) for c in self.COLUMNS)) for rel, entry in legacy.items()]
+            )
+            self.conn.commit()
+        try:
+            json_path.replace(json_path.with_name(json_path.name + ".migrated"))
+        except FileNotFoundError:
+            return
+        print(f"📦 Migrated {len(legacy)} file states from {json_path.name}")
+
+    def _row(self, row):
+        return {c: v for c, v in zip(self.COLUMNS, row) if v is not None}
+
+    def get(self, rel: str, default=None):
+        with self.lock:
+            if rel in self.pending:
+                entry = self.pending[rel]
+                return default if entry is None else entry
+            row = self.conn.execute(
+                "SELECT mtime, size, hash, skipped, last_indexed FROM files WHERE path = ?", (rel,)
+            ).fetchone()
+        return self._row(row) if row else default
+
+    def __getitem__(self, rel: str):
+        entry = self.get(rel)
+        if entry is None:
+            raise KeyError(rel)
+        return entry
+
+    def __contains__(self, rel: str):
+        return self.get(rel) is not None
+
+    def __setitem__(self, rel: str, entry: dict):
+        with self.lock:
+            self.pending[rel] = entry
+
+    def pop(self, rel: str, default=None):
+        with self.lock:
+            entry = self.get(rel, default)
+            self.pending[rel] = None
+        return entry
+
+    def under(self, prefix: str):
+        """Paths below a directory prefix (ending in "/"), via a range scan on the primary key."""
+        with self.lock:
+            paths = {r[0] for r in self.conn.execute(
+                "SELECT path FROM files WHERE path >= ? AND path < ?", (prefix, prefix + "\U0010ffff")
+            )}
+            for rel, entry in self.pending.items():
+                if rel.startswith(prefix):
+                    (paths.add if entry is not None else paths.discard)(rel)
+        return sorted(paths)
+
+    def __iter__(self):
+        return iter(self.under(""))
+
+    def __len__(self):
+        return len(self.under(""))
+
+    def clear(self):
+        with self.lock:
+            self.pending = {}
+            with self.conn:
+                self.conn.execute("DELETE FROM files")
+
+    def commit(self):
+        with self.lock:
+            if not self.pending:
+                return
+            upserts = [(rel, *(e.get(c) for c in self.COLUMNS)) for rel, e in self.pending.items() if e is not None]
+            deletes = [(rel,) for rel, e in self.pending.items() if e is None]
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", upserts)
+                self.conn.executemany("DELETE FROM files WHERE path = ?", deletes)
+            self.pending = {}
+
+class TokenBudget:
+    """Tokens-per-minute throttle shared by every embedding request of one Embedder.
+
+    A token bucket refilled at tpm/60 per second; a 429 pauses it for the server's Retry-After.
+    """
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.updated = time.monotonic()
+            self.paused_until = max(self.paused_until, self.updated + seconds)
+            self.tokens = 0.0
+
+    def acquire(self, n: int):
+        n = min(n, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = max(self.paused_until - now, (n - self.tokens) / self.rate)
+                self.waited += wait
+            time.sleep(wait)
+
+class OnnxEmbedder:
+    """Sentence embeddings from an int8-quantized ONNX export on onnxruntime (CPU).
+
+    Mirrors the SentenceTransformer pipeline of the MiniLM-style models
+    (tokenize → transformer → mean pooling → L2 normalize), so vectors match the
+    torch path within quantization error. Texts are sorted by length before
+    batching so each batch pads to a similar length. `model` is a Hugging Face
+    repo id (bare names resolve under sentence-transformers/) or a local
+    directory holding tokenizer.json and onnx/<file_name>.
+    """
+    MAX_LENGTH = 256
+
+    def __init__(self, model: str, threads: int = 0, batch_size: int = 64, file_name: str = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        file_name = file_name or self.quantized_file()
+        if os.path.isdir(model):
+            fetch = lambda name: os.path.join(model, name)
+        else:
+            from huggingface_hub import hf_hub_download
+            repo = model if "/" in model else f"sentence-transformers/{model}"
+            fetch = lambda name: hf_hub_download(repo, name)
+        self.tokenizer = Tokenizer.from_file(fetch("tokenizer.json"))
+        self.tokenizer.enable_truncation(self.MAX_LENGTH)
+        self.tokenizer.enable_padding()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(fetch(f"onnx/{file_name}"), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_size = max(1, batch_size)
+
+    @staticmethod
+    def quantized_file():
+        """The int8 export matching this CPU's vector extensions."""
+        if platform.machine().lower() in ("arm64", "aarch64"):
+            return "model_qint8_arm64.onnx"
+        try:
+            with open("/proc/cpuinfo") as f:
+                flags = next((line for line in f if line.startswith("flags")), "").split()
+        except OSError:
+            flags = []
+        if "avx512_vnni" in flags:
+            return "model_qint8_avx512_vnni.onnx"
+        if "avx512f" in flags:
+            return "model_qint8_avx512.onnx"
+        return "model_quint8_avx2.onnx"
+
+    def encode(self, texts):
+        import numpy as np
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            encoded = self.tokenizer.encode_batch([texts[i] for i in batch])
+            ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+            hidden = self.session.run(None, feeds)[0]
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for i, vector in zip(batch, pooled):
+                vectors[i] = vector
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
 
 class Embedder:
-    def __init__(self):
+    """Embeds text with OpenAI when OPENAI_API_KEY is set, else a local SentenceTransformer.
+
+    The backend client or model is created on the first embed call, not at construction.
+    OpenAI calls are split to the API's per-request input and token limits, run up to
+    `max_in_flight` at a time, throttled to `tokens_per_minute` and retried on 429/5xx.
+    Tokens are counted with tiktoken when it is installed, else estimated at a
+    conservative 2 characters per token; an input the API still finds too long is
+    split out and clipped further.
+    """
+    MAX_INPUTS = 2048
+    MAX_REQUEST_TOKENS = 300_000
+    MAX_INPUT_TOKENS = 8191
+    MAX_RETRIES = 6
+
+    def __init__(self, cache_path=None, cache_max_entries: int = 500_000, max_in_flight: int = 4,
+                 tokens_per_minute: int = None, local_backend: str = "torch", local_threads: int = 0,
+                 local_batch_size: int = 64, query_cache_size: int = 1024, sidecar: str = None):
         self.openai_client = None
         self.local_embedder = None
-        self.model = None
-        if os.getenv("OPENAI_API_KEY"):
-            self.openai_client = OpenAI()
+        self.tokenizer = None
+        self.use_openai = bool(os.getenv("OPENAI_API_KEY"))
+        if self.use_openai:
             self.model = "text-embedding-3-large"
-            print("✅ Using OpenAI text-embedding-3-large (highest quality)")
+            self.dimensions = 1024
         else:
-            self.local_embedder = SentenceTransformer("all-MiniLM-L6-v2")
-            print("⚠️  Using local embeddings (set OPENAI_API_KEY for best results)")
+            self.model = "all-MiniLM-L6-v2"
+            self.dimensions = None
+        self.cache = EmbeddingCache(cache_path, cache_max_entries) if cache_path else None
+        self.hits = 0
+        self.misses = 0
+        self.stats_lock = threading.Lock()
+        self.backend_lock = threading.Lock()
+        self.load_seconds = None
+        self.local_backend = local_backend
+        self.sidecar = sidecar
+        self.sidecar_client = None
+        self.query_cache = OrderedDict()
+        self.query_cache_size = query_cache_size
+        self.query_hits = 0
+        self.query_misses = 0
+        self.local_threads = local_threads
+        self.local_batch_size = local_batch_size
+        self.max_in_flight = max(1, max_in_flight)
+        self.request_pool = None
+        self.in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self.budget = TokenBudget(tokens_per_minute) if tokens_per_minute else None
+        self.requests = 0
+        self.retries = 0
+
+    def _load_backend(self):
+        with self.backend_lock:
+            if self.openai_client or self.local_embedder or self.sidecar_client:
+                return
+            started = time.perf_counter()
+            if self.sidecar:
+                client = SidecarClient(self.sidecar)
+                info = client.info()
+                if (info["model"], info["dimensions"]) != (self.model, self.dimensions):
+                    raise RuntimeError(f"embedding sidecar serves {info['model']} ({info['dimensions']} dims),"
+                                       f" expected {self.model} ({self.dimensions} dims)")
+                self.sidecar_client = client
+                print(f"🔌 Using embedding sidecar at {self.sidecar} ({self.model})")
+            elif self.use_openai:
+                from openai import OpenAI
+                self.openai_client = OpenAI(max_retries=0)
+                try:
+                    import tiktoken
+                    self.tokenizer = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    self.tokenizer = None
+                self.request_pool = ThreadPoolExecutor(self.max_in_flight, thread_name_prefix="oracle-openai")
+                print("✅ Using OpenAI text-embedding-3-large (highest quality)")
+            elif self.local_backend == "onnx":
+                self.local_embedder = OnnxEmbedder(self.model, self.local_threads, self.local_batch_size)
+                print("⚠️  Using local int8 ONNX embeddings (set OPENAI_API_KEY for best results)")
+            else:
+                from sentence_transformers import SentenceTransformer
+                if self.local_threads:
+                    import torch
+                    torch.set_num_threads(self.local_threads)
+                self.local_embedder = SentenceTransformer(self.model)
+                print("⚠️  Using local embeddings (set OPENAI_API_KEY for best results)")
+            self.load_seconds = round(time.perf_counter() - started, 3)
+
+    def space(self):
+        """Identifies the vector space this embedder writes; recorded on every collection it fills."""
+        return {"embedding_model": self.model, "embedding_dimensions": self.dimensions or 0}
+
+    def _cache_key(self, text: str) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{self.model}\0{self.dimensions or ''}\0".encode("utf-8"))
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    def embed_query(self, text: str):
+        """Embed one query, via an in-process LRU keyed by whitespace-normalized text.
+
+        Misses fall through to embed(), so the on-disk cache still spares repeated
+        network calls across restarts.
+        """
+        key = " ".join(text.split())
+        with self.stats_lock:
+            vector = self.query_cache.get(key)
+            if vector is not None:
+                self.query_cache.move_to_end(key)
+                self.query_hits += 1
+                return vector
+            self.query_misses += 1
+        vector = self.embed(key)[0]
+        self._remember_queries([(key, vector)])
+        return vector
+
+    def prewarm_queries(self, queries):
+        keys = list(dict.fromkeys(" ".join(q.split()) for q in queries))[:self.query_cache_size]
+        if keys:
+            self._remember_queries(zip(keys, self.embed(keys)))
+        return len(keys)
+
+    def _remember_queries(self, items):
+        with self.stats_lock:
+            for key, vector in items:
+                self.query_cache[key] = vector
+                self.query_cache.move_to_end(key)
+            while len(self.query_cache) > self.query_cache_size:
+                self.query_cache.popitem(last=False)
+
+    def query_cache_stats(self):
+        total = self.query_hits + self.query_misses
+        return {"size": len(self.query_cache), "hits": self.query_hits, "misses": self.query_misses,
+                "hit_rate": round(self.query_hits / total, 3) if total else None}
 
     def embed(self, texts):
         if isinstance(texts, str):
             texts = [texts]
+        if self.cache is None:
+            with self.stats_lock:
+                self.misses += len(texts)
+            return self._embed_uncached(texts)
+        keys = [self._cache_key(t) for t in texts]
+        vectors = self.cache.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        missed = sum(1 for k in keys if k in missing)
+        with self.stats_lock:
+            self.hits += len(texts) - missed
+            self.misses += missed
+        if missing:
+            computed = self._embed_uncached(list(missing.values()))
+            fresh = list(zip(missing.keys(), computed))
+            self.cache.put_many(fresh)
+            vectors.update(fresh)
+        return [vectors[k] for k in keys]
+
+    def _embed_uncached(self, texts):
+        if not (self.openai_client or self.local_embedder or self.sidecar_client):
+            self._load_backend()
+        if self.sidecar_client:
+            return self.sidecar_client.embed(texts)
         if self.openai_client:
-            resp = self.openai_client.embeddings.create(
-                input=texts, model=self.model, dimensions=1024
-            )
-            return [e.embedding for e in resp.data]
-        return self.local_embedder.encode(texts).tolist()
+            batches = self._request_batches(texts)
+            if len(batches) == 1:
+                return self._request(batches[0])
+            return [v for vectors in self.request_pool.map(self._request, batches) for v in vectors]
+        if isinstance(self.local_embedder, OnnxEmbedder):
+            return self.local_embedder.encode(texts).tolist()
+        return self.local_embedder.encode(texts, batch_size=self.local_batch_size).tolist()
+
+    def _tokens(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, disallowed_special=()))
+        return len(text) // 2 + 1
+
+    def _clip(self, text: str):
+        """Cut text to the per-input token limit; returns (text, tokens)."""
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, disallowed_special=())
+            if len(ids) > self.MAX_INPUT_TOKENS:
+                ids = ids[:self.MAX_INPUT_TOKENS]
+                text = self.tokenizer.decode(ids)
+            return text, len(ids)
+        text = text[:self.MAX_INPUT_TOKENS * 2]
+        return text, self._tokens(text)
+
+    def _request_batches(self, texts):
+        """Pack texts in order into requests within the input-count and token limits."""
+        batches, batch, tokens = [], [], 0
+        for text in texts:
+            text, n = self._clip(text)
+            if batch and (len(batch) >= self.MAX_INPUTS or tokens + n > self.MAX_REQUEST_TOKENS):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(text)
+            tokens += n
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _split_request(self, batch):
+        """Retry a batch the API rejected as too long: halve it, or clip a lone input to half its length."""
+        if len(batch) > 1:
+            mid = len(batch) // 2
+            return self._request(batch[:mid]) + self._request(batch[mid:])
+        text = batch[0][:len(batch[0]) // 2]
+        if not text:
+            raise ValueError("embedding input rejected as too long even when clipped")
+        print(f"⚠️ Embedding input over the model's context length, clipping to {len(text)} chars")
+        return self._request([text])
+
+    @staticmethod
+    def _retry_after(error):
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return None
+
+    def _request(self, batch):
+        tokens = sum(self._tokens(t) for t in batch) if self.budget else 0
+        for attempt in range(self.MAX_RETRIES + 1):
+            if self.budget:
+                self.budget.acquire(tokens)
+            try:
+                with self.in_flight:
+                    resp = self.openai_client.embeddings.create(
+                        input=batch, model=self.model, dimensions=self.dimensions
+                    )
+                with self.stats_lock:
+                    self.requests += 1
+                return [e.embedding for e in resp.data]
+            except Exception as e:
+                status = getattr(e, "status_code", None)
+                if status == 400 and "maximum context length" in str(e):
+                    return self._split_request(batch)
+                transient = type(e).__name__ in ("APIConnectionError", "APITimeoutError")
+                if attempt == self.MAX_RETRIES or not (transient or status in (408, 409, 429)
+                                                      or (status or 0) >= 500):
+                    raise
+                retry_after = self._retry_after(e)
+                if retry_after is not None:
+                    delay = retry_after + random.uniform(0, 0.25 * retry_after + 0.1)
+                else:
+                    delay = random.uniform(0, min(60.0, 2.0 ** attempt))
+                if status == 429 and self.budget:
+                    self.budget.pause(delay)
+                with self.stats_lock:
+                    self.retries += 1
+                print(f"⚠️ Embedding request failed ({status or type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+def _send_frame(sock, payload: bytes):
+    sock.sendall(struct.pack("!I", len(payload)) + payload)
+
+def _recv_frame(sock):
+    header = _recv_exact(sock, 4)
+    if header is None:
+        return None
+    (length,) = struct.unpack("!I", header)
+    return _recv_exact(sock, length)
+
+def _recv_exact(sock, n: int):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(min(n - len(buf), 1 << 20))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+class SidecarClient:
+    """Client for an EmbeddingSidecar on a Unix socket; one persistent connection per thread.
+
+    Requests are a JSON frame; replies are a JSON header frame followed by one
+    frame of float32 vectors.
+    """
+    def __init__(self, socket_path: str, connect_timeout: float = 120.0):
+        self.socket_path = socket_path
+        self.connect_timeout = connect_timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self.local, "sock", None)
+        if sock is None:
+            deadline = time.monotonic() + self.connect_timeout
+            while True:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    sock.connect(self.socket_path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    sock.close()
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"embedding sidecar not reachable at {self.socket_path}")
+                    time.sleep(0.5)
+            self.local.sock = sock
+        return sock
+
+    def _call(self, request: dict):
+        sock = self._connection()
+        try:
+            _send_frame(sock, json.dumps(request).encode("utf-8"))
+            header = _recv_frame(sock)
+            if header is None:
+                raise ConnectionError("embedding sidecar closed the connection")
+            header = json.loads(header)
+            if header.get("error"):
+                raise RuntimeError(f"embedding sidecar: {header['error']}")
+            body = _recv_frame(sock) if "dim" in header else b""
+        except (OSError, ValueError):
+            sock.close()
+            self.local.sock = None
+            raise
+        return header, body
+
+    def info(self):
+        return self._call({"op": "info"})[0]
+
+    def embed(self, texts):
+        header, body = self._call({"op": "embed", "texts": list(texts)})
+        flat, dim = array("f", body), header["dim"]
+        return [flat[i * dim:(i + 1) * dim].tolist() for i in range(header["n"])]
+
+class EmbeddingSidecar:
+    """Loads one embedding backend and serves embed requests from other processes on a Unix socket.
+
+    Requests arriving within `max_wait_ms` of each other are merged into one
+    backend call of up to `max_batch` texts (dynamic micro-batching), so many
+    gunicorn workers and build threads share a single model copy. Local models
+    get one batcher thread; OpenAI gets one per request allowed in flight.
+    """
+    def __init__(self, embedder, socket_path: str, max_batch: int = 256, max_wait_ms: float = 5.0):
+        self.embedder = embedder
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+
+    def submit(self, texts):
+        done = threading.Event()
+        slot = {"texts": texts, "done": done}
+        self.pending.put(slot)
+        done.wait()
+        if "error" in slot:
+            raise slot["error"]
+        return slot["vectors"]
+
+    def _batcher(self):
+        while True:
+            batch = [self.pending.get()]
+            size = len(batch[0]["texts"])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    slot = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(slot)
+                size += len(slot["texts"])
+            texts = [t for slot in batch for t in slot["texts"]]
+            try:
+                vectors = self.embedder._embed_uncached(texts) if texts else []
+            except Exception as e:
+                for slot in batch:
+                    slot["error"] = e
+                    slot["done"].set()
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for slot in batch:
+                slot["vectors"] = vectors[offset:offset + len(slot["texts"])]
+                offset += len(slot["texts"])
+                slot["done"].set()
+
+    def serve_forever(self):
+        sidecar = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    frame = _recv_frame(self.request)
+                    if frame is None:
+                        return
+                    try:
+                        request = json.loads(frame)
+                        if request.get("op") == "info":
+                            _send_frame(self.request, json.dumps({
+                                "model": sidecar.embedder.model, "dimensions": sidecar.embedder.dimensions,
+                                "batches": sidecar.batches, "texts": sidecar.texts
+                            }).encode("utf-8"))
+                            continue
+                        vectors = sidecar.submit(request["texts"])
+                    except Exception as e:
+                        _send_frame(self.request, json.dumps({"error": str(e)}).encode("utf-8"))
+                        continue
+                    dim = len(vectors[0]) if vectors else 0
+                    flat = array("f", (x for v in vectors for x in v))
+                    _send_frame(self.request, json.dumps({"n": len(vectors), "dim": dim}).encode("utf-8"))
+                    _send_frame(self.request, flat.tobytes())
+
+        self.embedder._load_backend()
+        for i in range(self.embedder.max_in_flight if self.embedder.use_openai else 1):
+            threading.Thread(target=self._batcher, name=f"oracle-sidecar-batch-{i}", daemon=True).start()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        server.daemon_threads = True
+        print(f"🔌 Embedding sidecar serving {self.embedder.model} on {self.socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
 
 class ProjectMemory:
-    def __init__(self, chroma_client):
+    def __init__(self, chroma_client, embedder):
+        self.chroma = chroma_client
         self.collection = chroma_client.get_or_create_collection("project_memory")
+        self.embedder = embedder
 
     def log(self, query: str, returned_files: list, insight: str = ""):
         doc = f"Query: {query}\nReturned files: {', '.join(returned_files)}\nInsight: {insight}"
         self.collection.add(
             documents=[doc],
+            embeddings=self.embedder.embed(doc),
             metadatas=[{"timestamp": datetime.now().isoformat(), "query": query}],
             ids=[f"mem_{datetime.now().timestamp():.0f}"]
         )
 
+    def reembed(self):
+        """Re-embed every stored entry with the current embedder (memory is small).
+
+        Chroma fixes a collection's dimension on first write, so the collection is
+        recreated rather than updated in place.
+        """
+        got = self.collection.get(include=["documents", "metadatas"])
+        embeddings = self.embedder.embed(got["documents"]) if got["ids"] else []
+        metadata = {k: v for k, v in (self.collection.metadata or {}).items() if not k.startswith("hnsw:")}
+        self.chroma.delete_collection("project_memory")
+        self.collection = self.chroma.get_or_create_collection("project_memory", metadata=metadata or None)
+        for i in range(0, len(got["ids"]), 256):
+            self.collection.add(ids=got["ids"][i:i + 256], embeddings=embeddings[i:i + 256],
+                                documents=got["documents"][i:i + 256], metadatas=got["metadatas"][i:i + 256])
+
+    def file_hits(self):
+        """How often each file has been returned to a query, parsed from the logged entries."""
+        hits = Counter()
+        for doc in self.collection.get(include=["documents"])["documents"] or []:
+            for line in doc.splitlines():
+                if line.startswith("Returned files: "):
+                    hits.update(f for f in line[len("Returned files: "):].split(", ") if f)
+        return hits
+
+    def frequent_queries(self, n: int = 100):
+        counts = Counter(m["query"] for m in self.collection.get(include=["metadatas"])["metadatas"] or []
+                         if m and m.get("query"))
+        return [q for q, _ in counts.most_common(n)]
+
     def get_project_state(self, k: int = 10):
-        results = self.collection.query(query_texts=["project overview and decisions"], n_results=k)
+        results = self.collection.query(
+            query_embeddings=[self.embedder.embed_query("project overview and decisions")], n_results=k
+        )
         return {"recent_activity": results.get("documents", [[]])[0]}
 
+class ChunkWriter:
+    """Buffers chunk upserts, metadata updates and deletes across files and flushes them in large batches."""
+    def __init__(self, collection, batch_size: int = 1000):
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.embedded = {}
+        self.updates = {}
+        self.deletes = set()
+        self.pending_files = set()
+        self.written = 0
+
+    def _pending(self):
+        return len(self.embedded) + len(self.updates) + len(self.deletes)
+
+    def add(self, record, embedding):
+        self.embedded[record["id"]] = (record, embedding)
+        self.pending_files.add(record["metadata"]["file"])
+        if self._pending() >= self.batch_size:
+            self.flush()
+
+    def update_metadata(self, record):
+        self.updates[record["id"]] = record["metadata"]
+        self.pending_files.add(record["metadata"]["file"])
+        if self._pending() >= self.batch_size:
+            self.flush()
+
+    def delete(self, ids, rel_path: str):
+        self.deletes.update(ids)
+        self.pending_files.add(rel_path)
+        if self._pending() >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        deletes = sorted(self.deletes)
+        self.deletes.clear()
+        for i in range(0, len(deletes), self.batch_size):
+            self.collection.delete(ids=deletes[i:i + self.batch_size])
+        items = list(self.embedded.values())
+        self.embedded.clear()
+        for i in range(0, len(items), self.batch_size):
+            batch = items[i:i + self.batch_size]
+            self.collection.upsert(
+                ids=[r["id"] for r, _ in batch],
+                documents=[r["text"] for r, _ in batch],
+                metadatas=[r["metadata"] for r, _ in batch],
+                embeddings=[e for _, e in batch]
+            )
+            self.written += len(batch)
+        updates = list(self.updates.items())
+        self.updates.clear()
+        for i in range(0, len(updates), self.batch_size):
+            batch = updates[i:i + self.batch_size]
+            self.collection.update(ids=[k for k, _ in batch], metadatas=[m for _, m in batch])
+        self.pending_files.clear()
+
+def file_digest(data: bytes) -> str:
+    """Fast content hash used for change detection."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def chunk_id(rel_path: str, language: str, symbol_path: str, text: str) -> str:
+    """Stable chunk ID: unaffected by chunks added or removed elsewhere in the file."""
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=6).hexdigest()
+    return f"{rel_path}:{language}:{symbol_path}:{digest}"
+
+def hash_file(file_path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+_DONE = object()
+
+class PipelineAborted(Exception):
+    pass
+
+class BuildCancelled(Exception):
+    pass
+
+class EmbeddingSpaceMismatch(RuntimeError):
+    pass
+
+class PipelineStage:
+    """`workers` threads pulling from a bounded inbox and pushing results to the next stage's inbox."""
+    def __init__(self, pipeline, name, fn, workers, inbox, outbox, batch_weight=None, batch_limit=1):
+        self.pipeline = pipeline
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.batch_weight = batch_weight
+        self.batch_limit = batch_limit
+        self.items = 0
+        self.busy = 0.0
+        self.depth_max = 0
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.lock = threading.Lock()
+        self.remaining = self.workers
+
+    def _emit(self, outputs):
+        if self.outbox is None:
+            return
+        for out in outputs:
+            self.pipeline.put(self.outbox, out)
+
+    def _take(self):
+        """Block for one item, then greedily add queued items up to the batch limit."""
+        item = self.pipeline.get(self.inbox)
+        if item is _DONE:
+            return item, []
+        with self.lock:
+            depth = self.inbox.qsize() + 1
+            self.depth_max = max(self.depth_max, depth)
+            self.depth_total += depth
+            self.depth_samples += 1
+        if self.batch_weight is None:
+            return item, []
+        batch, weight = [item], self.batch_weight(item)
+        while weight < self.batch_limit:
+            try:
+                nxt = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is _DONE:
+                return batch, [_DONE]
+            batch.append(nxt)
+            weight += self.batch_weight(nxt)
+        return batch, []
+
+    def run_worker(self):
+        try:
+            if self.inbox is None:
+                started = time.perf_counter()
+                for out in self.fn():
+                    self.busy += time.perf_counter() - started
+                    self.items += 1
+                    self._emit([out])
+                    started = time.perf_counter()
+            else:
+                while True:
+                    item, trailer = self._take()
+                    if item is _DONE:
+                        self.pipeline.put(self.inbox, _DONE)
+                        break
+                    started = time.perf_counter()
+                    outputs = self.fn(item)
+                    elapsed = time.perf_counter() - started
+                    with self.lock:
+                        self.busy += elapsed
+                        self.items += len(item) if self.batch_weight else 1
+                    self._emit(outputs or [])
+                    if trailer:
+                        self.pipeline.put(self.inbox, _DONE)
+                        break
+        except PipelineAborted:
+            return
+        except BaseException as e:
+            self.pipeline.fail(e)
+            return
+        with self.lock:
+            self.remaining -= 1
+            last = self.remaining == 0
+        if last and self.outbox is not None:
+            try:
+                self.pipeline.put(self.outbox, _DONE)
+            except PipelineAborted:
+                pass
+
+    def stats(self, wall: float):
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "busy_s": round(self.busy, 3),
+            "items_per_s": round(self.items / wall, 1) if wall else 0.0,
+            "queue_max": self.depth_max,
+            "queue_avg": round(self.depth_total / self.depth_samples, 1) if self.depth_samples else 0.0,
+        }
+
+class BuildPipeline:
+    """Concurrent build stages connected by bounded queues, so memory stays flat under backpressure."""
+    def __init__(self, queue_size: int = 64):
+        self.queue_size = max(1, queue_size)
+        self.stages = []
+        self.abort = threading.Event()
+        self.error = None
+        self.wall = 0.0
+
+    def queue(self):
+        return queue.Queue(self.queue_size)
+
+    def put(self, q, item):
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, q):
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.abort.set()
+
+    def stage(self, name, fn, workers=1, inbox=None, outbox=None, **batching):
+        stage = PipelineStage(self, name, fn, workers, inbox, outbox, **batching)
+        self.stages.append(stage)
+        return stage
+
+    def run(self):
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=stage.run_worker, name=f"oracle-{stage.name}-{i}", daemon=True)
+            for stage in self.stages for i in range(stage.workers)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.wall = time.perf_counter() - started
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        return [stage.stats(self.wall) for stage in self.stages]
+
+class BuildJob:
+    """One requested build: its parameters, lifecycle and live progress."""
+    def __init__(self, params: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.requests = 1
+        self.cancel_event = threading.Event()
+        self.pipeline = None
+        self.chunk_stats = None
+        self.usable_at = None
+
+    def attach(self, pipeline, chunk_stats):
+        self.pipeline = pipeline
+        self.chunk_stats = chunk_stats
+        if self.cancel_event.is_set():
+            pipeline.fail(BuildCancelled("build cancelled"))
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.pipeline is not None:
+            self.pipeline.fail(BuildCancelled("build cancelled"))
+
+    def progress(self):
+        done = total = embedded = 0
+        total_final = False
+        if self.pipeline is not None:
+            walk, write = self.pipeline.stages[0], self.pipeline.stages[-1]
+            total, done, total_final = walk.items, write.items, walk.remaining == 0
+            embedded = self.chunk_stats["new"]
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        eta = None
+        if self.status == "running" and total_final and done:
+            eta = round(elapsed / done * (total - done), 1)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "params": self.params,
+            "requests": self.requests,
+            "error": self.error,
+            "created": datetime.fromtimestamp(self.created).isoformat(),
+            "started": datetime.fromtimestamp(self.started).isoformat() if self.started else None,
+            "finished": datetime.fromtimestamp(self.finished).isoformat() if self.finished else None,
+            "usable_after_s": round(self.usable_at - self.started, 1) if self.usable_at else None,
+            "files_done": done,
+            "files_total": total,
+            "files_total_final": total_final,
+            "chunks_embedded": embedded,
+            "chunks_per_s": round(embedded / elapsed, 1) if elapsed else 0.0,
+            "elapsed_s": round(elapsed, 1),
+            "eta_s": eta,
+        }
+
+class BuildJobManager:
+    """Runs builds one at a time across every process that shares the index.
+
+    Jobs live in a SQLite table in .oracle_index, so any server worker can look
+    up, join or cancel a job that another worker started. Each manager's thread
+    claims the oldest queued job whenever no build is running; the owner
+    publishes progress and a heartbeat, and picks up cancel requests from the
+    table. A request identical to a queued job joins it. A running job has
+    already chosen its files, so an identical request queues one follow-up
+    build, which later identical requests then join.
+    """
+    HEARTBEAT_SECONDS = 1.0
+    STALE_SECONDS = 30.0
+    FIELDS = "id, params, status, requests, cancel, created, progress"
+
+    def __init__(self, oracle, history: int = 50):
+        self.oracle = oracle
+        self.history = history
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(oracle.index_dir / "build_jobs.db"), check_same_thread=False,
+                                    timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, params TEXT, status TEXT, requests INTEGER,"
+            " cancel INTEGER DEFAULT 0, owner INTEGER, heartbeat REAL,"
+            " created REAL, progress TEXT)"
+        )
+        self.local = {}
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="oracle-build-jobs", daemon=True)
+        self.thread.start()
+
+    @contextmanager
+    def _transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def _view(self, row):
+        job_id, _, status, requests, _, _, progress = row
+        job = self.local.get(job_id)
+        view = job.progress() if job is not None and status == "running" else json.loads(progress)
+        view.update(status=status, requests=requests)
+        return view
+
+    def _reap(self, conn):
+        """Fail running jobs whose owner stopped heartbeating (e.g. its worker was killed)."""
+        stale = conn.execute(
+            "SELECT id, progress FROM jobs WHERE status = 'running' AND heartbeat < ?",
+            (time.time() - self.STALE_SECONDS,)
+        ).fetchall()
+        for job_id, progress in stale:
+            progress = {**json.loads(progress), "status": "failed", "error": "build worker stopped responding",
+                        "finished": datetime.now().isoformat()}
+            conn.execute("UPDATE jobs SET status = 'failed', progress = ? WHERE id = ?",
+                         (json.dumps(progress), job_id))
+
+    def submit(self, **params):
+        """Returns (job progress, coalesced)."""
+        key = json.dumps(params, sort_keys=True)
+        with self._transaction() as conn:
+            self._reap(conn)
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE params = ? AND cancel = 0"
+                " AND status = 'queued' ORDER BY created LIMIT 1",
+                (key,)
+            ).fetchone()
+            if row:
+                job_id, coalesced = row[0], True
+                conn.execute("UPDATE jobs SET requests = requests + 1 WHERE id = ?", (job_id,))
+            else:
+                job = BuildJob(params)
+                job_id, coalesced = job.id, False
+                conn.execute(
+                    "INSERT INTO jobs (id, params, status, requests, created, progress) VALUES (?, ?, ?, 1, ?, ?)",
+                    (job.id, key, job.status, job.created, json.dumps(job.progress()))
+                )
+                conn.execute(
+                    "DELETE FROM jobs WHERE status NOT IN ('queued', 'running')"
+                    " AND id NOT IN (SELECT id FROM jobs ORDER BY created DESC LIMIT ?)", (self.history,)
+                )
+        self.wake.set()
+        return self.get(job_id), coalesced
+
+    def get(self, job_id: str):
+        with self.lock:
+            row = self.conn.execute(f"SELECT {self.FIELDS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._view(row) if row else None
+
+    def cancel(self, job_id: str):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status, progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            status, progress = row
+            if status == "queued":
+                progress = {**json.loads(progress), "status": "cancelled", "finished": datetime.now().isoformat()}
+                conn.execute("UPDATE jobs SET status = 'cancelled', cancel = 1, progress = ? WHERE id = ?",
+                             (json.dumps(progress), job_id))
+            elif status == "running":
+                conn.execute("UPDATE jobs SET cancel = 1 WHERE id = ?", (job_id,))
+        job = self.local.get(job_id)
+        if job is not None:
+            job.cancel()
+        return self.get(job_id)
+
+    def _claim(self):
+        with self._transaction() as conn:
+            self._reap(conn)
+            if conn.execute("SELECT 1 FROM jobs WHERE status = 'running'").fetchone():
+                return None
+            row = conn.execute(
+                "SELECT id, params, created FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            job = BuildJob(json.loads(row[1]))
+            job.id, job.created = row[0], row[2]
+            job.status = "running"
+            job.started = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, progress = ? WHERE id = ?",
+                (os.getpid(), job.started, json.dumps(job.progress()), job.id)
+            )
+        self.local[job.id] = job
+        return job
+
+    def _monitor(self, job):
+        """Publishes the owner's live progress and heartbeat, and applies cancel requests from other workers."""
+        while True:
+            time.sleep(self.HEARTBEAT_SECONDS)
+            with self.lock:
+                if job.status != "running":
+                    return
+                self.conn.execute("UPDATE jobs SET heartbeat = ?, progress = ? WHERE id = ?",
+                                  (time.time(), json.dumps(job.progress()), job.id))
+                cancel = self.conn.execute("SELECT cancel FROM jobs WHERE id = ?", (job.id,)).fetchone()[0]
+            if cancel and not job.cancel_event.is_set():
+                job.cancel()
+
+    def _run(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self.wake.wait(self.HEARTBEAT_SECONDS)
+                self.wake.clear()
+                continue
+            threading.Thread(target=self._monitor, args=(job,), name="oracle-build-monitor", daemon=True).start()
+            try:
+                self.oracle.build(job=job, **job.params)
+                status = "done"
+            except BuildCancelled:
+                status = "cancelled"
+            except Exception as e:
+                status = "failed"
+                job.error = str(e)
+                print(f"⚠️ Build {job.id} failed: {e}")
+            with self.lock:
+                job.status = status
+                job.finished = time.time()
+                self.conn.execute("UPDATE jobs SET status = ?, heartbeat = ?, progress = ? WHERE id = ?",
+                                  (status, job.finished, json.dumps(job.progress()), job.id))
+            self.local.pop(job.id, None)
+
+class IndexWatcher:
+    """inotify watch over the indexed tree that reindexes changed files after a quiet period.
+
+    Events are collected per path and coalesced until nothing has changed for
+    `debounce` seconds, then handed to CodebaseContextOracle.reindex_paths.
+    The loop blocks in select() while idle. Linux only.
+    """
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                  | IN_DELETE_SELF | IN_ONLYDIR)
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, oracle, debounce: float = 0.5):
+        self.oracle = oracle
+        self.debounce = debounce
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = -1
+        self.dirs = {}
+        self.pending = set()
+        self.rescan = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock_file = None
+        self.stats = {"events": 0, "batches": 0, "files": 0, "last_batch_s": 0.0}
+
+    def _add_tree(self, rel_dir: str):
+        """Watch rel_dir and every non-excluded directory below it."""
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            path = str(self.oracle.root / current) if current else str(self.oracle.root)
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WATCH_MASK)
+            if wd < 0:
+                print(f"⚠️ Cannot watch {path}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self.dirs[wd] = current
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        rel = f"{current}/{entry.name}" if current else entry.name
+                        if entry.is_dir(follow_symlinks=False) and not self.oracle.ignore.excluded(rel, True):
+                            stack.append(rel)
+            except OSError:
+                continue
+
+    def start(self):
+        """Start watching in a background thread. Returns False if another process already watches this index."""
+        if not sys.platform.startswith("linux"):
+            raise RuntimeError("the index watcher needs Linux inotify")
+        self.lock_file = open(self.oracle.index_dir / "watch.lock", "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._add_tree("")
+        print(f"👀 Watching {len(self.dirs)} directories under {self.oracle.root}")
+        self.thread = threading.Thread(target=self._run, name="oracle-watch", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def _read_events(self):
+        try:
+            buf = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + self.EVENT.size <= len(buf):
+            wd, mask, _, length = self.EVENT.unpack_from(buf, offset)
+            name = os.fsdecode(buf[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b"\0"))
+            offset += self.EVENT.size + length
+            self.stats["events"] += 1
+            if mask & self.IN_Q_OVERFLOW:
+                self.rescan = True
+                continue
+            if mask & self.IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            rel_dir = self.dirs.get(wd)
+            if rel_dir is None or not name:
+                continue
+            rel = f"{rel_dir}/{name}" if rel_dir else name
+            if name in IgnoreRules.IGNORE_FILES:
+                self.oracle.ignore = IgnoreRules(self.oracle.root)
+                self.rescan = True
+                continue
+            if mask & self.IN_ISDIR:
+                if self.oracle.ignore.excluded(rel, True):
+                    continue
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self._add_tree(rel)
+                    self.pending.update(self.oracle.ignore.walk(rel))
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    prefix = rel + "/"
+                    self.pending.update(self.oracle.metadata.under(prefix))
+            elif not self.oracle.ignore.excluded(rel, False):
+                self.pending.add(rel)
+
+    def _run(self):
+        last_event = 0.0
+        while not self.stop_event.is_set():
+            waiting = self.pending or self.rescan
+            timeout = max(0.0, last_event + self.debounce - time.monotonic()) if waiting else 1.0
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+            if ready:
+                self._read_events()
+                last_event = time.monotonic()
+                continue
+            if not (self.pending or self.rescan):
+                continue
+            paths, self.pending = self.pending, set()
+            started = time.perf_counter()
+            try:
+                if self.rescan:
+                    self.rescan = False
+                    self.oracle.build()
+                else:
+                    self.oracle.reindex_paths(paths)
+            except Exception as e:
+                print(f"⚠️ Watch reindex failed: {e}")
+            self.stats["batches"] += 1
+            self.stats["files"] += len(paths)
+            self.stats["last_batch_s"] = round(time.perf_counter() - started, 3)
+
+def _chunk_content_worker(job):
+    """Process-pool entry point: chunk one file's content with this worker's own parser and query."""
+    rel_path, lang_id, content, chunker = job
+    parser, query = _worker_parser(lang_id, chunker)
+    return CodebaseContextOracle._chunk_content(content, rel_path, lang_id, parser, chunker, query)
+
+_worker_parsers = {}
+
+def _worker_parser(lang_id, chunker):
+    if not lang_id:
+        return None, None
+    loaded = _worker_parsers.get(lang_id)
+    if loaded is None:
+        from tree_sitter_language_pack import get_parser
+        loaded = _worker_parsers[lang_id] = (get_parser(lang_id), chunker.compile_query(lang_id))
+    return loaded
+
 class CodebaseContextOracle:
     EXT_TO_LANG = {
         '.py': 'python', '.pyi': 'python',
@@ -64,145 +1988,690 @@ class CodebaseContextOracle:
         '.js': 'javascript', '.jsx': 'javascript',
         '.ts': 'typescript', '.tsx': 'typescript',
     }
+    ENTRY_POINTS = {
+        "main.py", "__main__.py", "__init__.py", "app.py", "server.py", "cli.py", "manage.py",
+        "main.rs", "lib.rs", "main.go", "Program.cs", "Main.java", "main.c", "main.cpp",
+        "index.js", "index.ts", "main.js", "main.ts", "app.js", "app.ts", "server.js", "server.ts",
+    }
 
-    def __init__(self, root_dir: str = "."):
+    def __init__(self, root_dir: str = ".", write_batch_size: int = 1000,
+                 max_file_bytes: int = 2_000_000, skip_globs=(), chunk_tokens: int = 800,
+                 min_chunk_tokens: int = 100, hierarchical_chunks: bool = True, parse_cache_size: int = 64,
+                 checkpoint_seconds: float = 60.0, embed_concurrency: int = 4, embed_tpm: int = None,
+                 local_backend: str = "torch", local_threads: int = 0, local_batch_size: int = 64,
+                 on_model_mismatch: str = "refuse", query_cache_size: int = 1024, embed_socket: str = None):
+        started = time.perf_counter()
+        self.startup_times = {}
         self.root = Path(root_dir).resolve()
         self.index_dir = self.root / ".oracle_index"
         self.index_dir.mkdir(exist_ok=True)
+        self.index_lock = threading.RLock()
+
+        self.embedder = Embedder(cache_path=self.index_dir / "embedding_cache.sqlite3",
+                                 max_in_flight=embed_concurrency, tokens_per_minute=embed_tpm,
+                                 local_backend=local_backend, local_threads=local_threads,
+                                 local_batch_size=local_batch_size, query_cache_size=query_cache_size,
+                                 sidecar=embed_socket)
+        self._startup_mark("embedder", started)
 
+        import chromadb
         self.chroma = chromadb.PersistentClient(path=str(self.index_dir))
         self.collection = self.chroma.get_or_create_collection("code_chunks")
-        self.memory = ProjectMemory(self.chroma)
+        self.memory = ProjectMemory(self.chroma, self.embedder)
+        self.writer = ChunkWriter(
+            self.collection, min(write_batch_size, self.chroma.get_max_batch_size())
+        )
+        self._startup_mark("chroma", started)
 
-        self.embedder = Embedder()
-        self.graph = nx.DiGraph()
+        self._graph = None
+        self.chunker = ASTChunker(chunk_tokens, min_chunk_tokens, hierarchical_chunks)
         self.parsers = {}
-        self._load_parsers()
+        self.queries = {}
+        self.parser_lock = threading.Lock()
+        self.parser_load_times = {}
 
-        self.metadata_path = self.index_dir / "metadata.json"
-        self.metadata = self._load_metadata()
+        self.metadata = FileStateStore(self.index_dir / "file_state.sqlite3")
+        if (self.index_dir / "metadata.json").exists():
+            with self._index_guard():
+                self.metadata.migrate_json(self.index_dir / "metadata.json")
+        self._startup_mark("file_state", started)
+        self.state_path = self.index_dir / "state.json"
+        self.state = self._load_state()
+        self._check_embedding_space(on_model_mismatch)
+        self.chunk_stats = {"new": 0, "unchanged": 0, "deleted": 0}
+        self.last_build_stats = []
+        self.ignore = IgnoreRules(self.root)
+        self.file_filter = FileFilter(max_file_bytes, skip_globs)
+        self.skip_stats = Counter()
+        self.unchanged_by_hash = 0
+        self.updated = 0
+        self.watcher = None
+        self.parse_cache = ParseCache(parse_cache_size)
+        self.checkpoint_seconds = checkpoint_seconds
+        self.hot_pending = set()
+        self.index_usable = self.collection.count() > 0
+        self.current_job = None
+        self.last_checkpoint = time.monotonic()
+        self._startup_mark("total", started)
 
-    def _load_parsers(self):
-        for lang_id in set(self.EXT_TO_LANG.values()):
-            try:
-                self.parsers[lang_id] = get_parser(lang_id)
-            except Exception as e:
-                print(f"⚠️ Could not load parser for {lang_id}: {e}")
+    def _check_embedding_space(self, on_mismatch: str):
+        """Make sure stored vectors come from the configured embedder.
+
+        An empty collection is labelled with the embedder's space. A populated code
+        index built with another model (or before spaces were recorded) raises
+        EmbeddingSpaceMismatch, or with on_mismatch="migrate" is dropped so the next
+        build re-embeds everything. Project memory is always re-embedded. Changes run
+        under the index guard, so server workers starting together migrate only once.
+        """
+        space = self.embedder.space()
+        recorded = lambda col: {k: (col.metadata or {}).get(k) for k in space}
+        if recorded(self.collection) == space and recorded(self.memory.collection) == space:
+            return
+        with self._index_guard():
+            # Another process may have migrated (or be building) while we waited for the lock.
+            self.collection = self.writer.collection = self.chroma.get_or_create_collection("code_chunks")
+            self.memory.collection = self.chroma.get_or_create_collection("project_memory")
+            self.state = self._load_state()
+            self._migrate_embedding_space(space, recorded, on_mismatch)
+
+    def _migrate_embedding_space(self, space, recorded, on_mismatch: str):
+        label = lambda col: col.modify(metadata={
+            **{k: v for k, v in (col.metadata or {}).items() if not k.startswith("hnsw:")}, **space
+        })
+        if recorded(self.collection) != space:
+            if self.collection.count() and on_mismatch != "migrate":
+                raise EmbeddingSpaceMismatch(
+                    f"Index at {self.index_dir} holds vectors from {recorded(self.collection)}, but the oracle"
+                    f" embeds with {space}. Restart with --on-model-mismatch migrate"
+                    f" (ORACLE_ON_MODEL_MISMATCH=migrate) to drop and re-embed it."
+                )
+            if self.collection.count():
+                print(f"♻️  Embedding model changed to {self.embedder.model}; dropping the code index for re-embedding")
+                self.chroma.delete_collection("code_chunks")
+                self.collection = self.writer.collection = self.chroma.get_or_create_collection("code_chunks")
+                self.metadata.clear()
+                self.state.pop("git_head", None)
+                self._save_state()
+            label(self.collection)
+        memory = self.memory.collection
+        if recorded(memory) != space:
+            if memory.count():
+                print(f"♻️  Re-embedding {memory.count()} project memory entries with {self.embedder.model}")
+                self.memory.reembed()
+            label(self.memory.collection)
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            import networkx as nx
+            self._graph = nx.DiGraph()
+        return self._graph
+
+    def _startup_mark(self, phase: str, started: float):
+        elapsed = time.perf_counter() - started
+        self.startup_times[phase] = round(elapsed - sum(self.startup_times.values()), 3) \
+            if phase != "total" else round(elapsed, 3)
+
+    def _parser(self, lang_id):
+        """(parser, definition query) for a language, loaded on first use; (None, None) if unavailable."""
+        if not lang_id:
+            return None, None
+        if lang_id in self.parsers:
+            return self.parsers[lang_id], self.queries.get(lang_id)
+        with self.parser_lock:
+            if lang_id not in self.parsers:
+                started = time.perf_counter()
+                try:
+                    from tree_sitter_language_pack import get_parser
+                    parser = get_parser(lang_id)
+                except Exception as e:
+                    print(f"⚠️ Could not load parser for {lang_id}: {e}")
+                    parser = None
+                if parser is not None:
+                    try:
+                        self.queries[lang_id] = self.chunker.compile_query(lang_id)
+                    except Exception as e:
+                        print(f"⚠️ Could not compile definition query for {lang_id}, using node-type scan: {e}")
+                self.parsers[lang_id] = parser
+                self.parser_load_times[lang_id] = round(time.perf_counter() - started, 3)
+        return self.parsers[lang_id], self.queries.get(lang_id)
+
+    @staticmethod
+    def _write_atomic(path: Path, text: str):
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
 
-    def _load_metadata(self):
-        if self.metadata_path.exists():
+    def _save_metadata(self):
+        self.metadata.commit()
+
+    @contextmanager
+    def _index_guard(self):
+        """Serialize index writers within this process and across processes sharing the index dir."""
+        with self.index_lock, open(self.index_dir / "build.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _load_state(self):
+        if self.state_path.exists():
             try:
-                return json.loads(self.metadata_path.read_text())
+                return json.loads(self.state_path.read_text())
             except:
                 pass
         return {}
 
-    def _save_metadata(self):
-        self.metadata_path.write_text(json.dumps(self.metadata, indent=2))
-
-    def build(self, force: bool = False):
-        print(f"🔍 Building index for {self.root}")
-        updated = 0
-        for file_path in sorted(self.root.rglob("*")):
-            if not file_path.is_file() or any(p.startswith('.') for p in file_path.parts):
-                continue
-            if self._should_index(file_path, force):
-                self._index_file(file_path)
-                updated += 1
-                if updated % 30 == 0:
-                    print(f"   Processed {updated} files...")
+    def _save_state(self):
+        self._write_atomic(self.state_path, json.dumps(self.state, indent=2))
+
+    def _checkpoint(self):
+        """Flush pending chunk writes, then persist metadata, so every file it lists is fully stored."""
+        self.writer.flush()
         self._save_metadata()
-        print(f"✅ Index ready! {updated} files updated • {self.collection.count()} chunks")
+        self.last_checkpoint = time.monotonic()
+
+    def _reconcile(self):
+        """Drop chunks of files a killed build wrote but never checkpointed and that are no longer indexable.
+
+        Files that still exist are not in metadata, so the build reindexes them and
+        the chunk diff keeps whatever was already stored.
+        """
+        known, orphans, offset, page = set(self.metadata), set(), 0, 5000
+        while True:
+            got = self.collection.get(include=["metadatas"], limit=page, offset=offset)
+            orphans.update(m["file"] for m in got["metadatas"] if m and m.get("file") not in known)
+            if len(got["ids"]) < page:
+                break
+            offset += page
+        gone = sorted(rel for rel in orphans if not self._is_indexable(rel))
+        for rel in gone:
+            self.collection.delete(where={"file": rel})
+        print(f"♻️  Resuming interrupted build from checkpoint ({len(known)} files done,"
+              f" {len(gone)} orphaned files dropped)")
+
+    def _git(self, *args):
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=self.root, capture_output=True, check=True
+            ).stdout.decode("utf-8", errors="surrogateescape")
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _git_head(self):
+        head = self._git("rev-parse", "--verify", "-q", "HEAD")
+        return head.strip() if head else None
+
+    def _git_changes(self, since: str):
+        """Paths (relative to root) touched since commit `since`, including uncommitted and untracked files.
+
+        Returns None when git cannot answer (not a repo, unknown commit).
+        """
+        diff = self._git("diff", "--name-status", "-z", "-M", "--relative", since, "--")
+        untracked = self._git("ls-files", "--others", "--exclude-standard", "-z")
+        if diff is None or untracked is None:
+            return None
+        paths = set(p for p in untracked.split("\0") if p)
+        tokens = diff.split("\0")
+        i = 0
+        while i < len(tokens) and tokens[i]:
+            status = tokens[i]
+            if status[0] in "RC":
+                paths.update(tokens[i + 1:i + 3])
+                i += 3
+            else:
+                paths.add(tokens[i + 1])
+                i += 2
+        return paths
+
+    def _is_indexable(self, rel_path: str) -> bool:
+        return not self.ignore.ignored(rel_path) and (self.root / rel_path).is_file()
+
+    def _scan_files(self, force: bool, seen: set):
+        """Walk the tree, yielding files that need indexing (hottest first) and recording every indexable path in `seen`."""
+        todo = []
+        for rel in self.ignore.walk():
+            seen.add(rel)
+            if self._should_index(self.root / rel, force):
+                todo.append(rel)
+        for rel in self._prioritize(todo):
+            yield self.root / rel
+
+    def _diff_files(self, paths, deleted: list):
+        """Yield the git-reported paths that need indexing; paths that no longer exist go to `deleted`."""
+        todo = []
+        for rel in sorted(paths):
+            if self._is_indexable(rel):
+                if self._should_index(self.root / rel, False):
+                    todo.append(rel)
+            elif rel in self.metadata:
+                deleted.append(rel)
+        for rel in self._prioritize(todo):
+            yield self.root / rel
+
+    def _prioritize(self, todo):
+        """Order pending files by how likely agents are to ask about them, and mark the hot set.
+
+        Signals: files returned to past queries (project memory), the newest tenth of
+        the pending files by mtime, entry points and files at most one directory deep.
+        The index is reported usable once every hot file has been written; an empty
+        index with no scored files takes the top tenth as its hot set.
+        """
+        hits = self.memory.file_hits()
+        mtimes = {}
+        for rel in todo:
+            try:
+                mtimes[rel] = (self.root / rel).stat().st_mtime
+            except OSError:
+                mtimes[rel] = 0.0
+        recent = set(sorted(todo, key=mtimes.get, reverse=True)[:len(todo) // 10])
+        scores = {}
+        for rel in todo:
+            entry = rel.rsplit("/", 1)[-1] in self.ENTRY_POINTS
+            scores[rel] = (3 * min(hits[rel], 5) + 2 * entry + (rel in recent)
+                           + (rel.count("/") <= 1))
+        ordered = sorted(todo, key=lambda rel: (-scores[rel], -mtimes[rel], rel))
+        self.hot_pending = {rel for rel in todo if hits[rel] or scores[rel] >= 2}
+        if not self.hot_pending and todo and not self.collection.count():
+            # Nothing scored, but an empty index is not usable yet: take the best tenth.
+            self.hot_pending = set(ordered[:max(1, len(todo) // 10)])
+        print(f"   {len(self.hot_pending)} of {len(todo)} files in the hot set")
+        if not self.hot_pending and self.collection.count():
+            self._mark_usable()
+        return ordered
+
+    def _mark_usable(self):
+        if self.index_usable:
+            return
+        self.index_usable = self.collection.count() > 0
+        if self.current_job is not None:
+            self.current_job.usable_at = time.time()
+        print(f"⚡ Index usable ({self.collection.count()} chunks); finishing the rest in the background")
+
+    def reindex_paths(self, rel_paths):
+        """Reindex just these paths (relative to root); paths that are gone or now ignored are removed."""
+        with self._index_guard():
+            updated = removed = 0
+            for rel in sorted(rel_paths):
+                if self._is_indexable(rel):
+                    file_path = self.root / rel
+                    if self._should_index(file_path, False):
+                        self._index_file(file_path)
+                        updated += 1
+                elif rel in self.metadata:
+                    self._remove_file(rel)
+                    removed += 1
+            self.writer.flush()
+            if updated or removed:
+                self._save_metadata()
+                print(f"🔄 Reindexed {updated} changed • {removed} removed")
+
+    def watch(self, debounce: float = 0.5):
+        """Start an IndexWatcher for this tree; returns it, or None if another process is already watching."""
+        watcher = IndexWatcher(self, debounce)
+        if not watcher.start():
+            print("👀 Another process is already watching this index")
+            return None
+        self.watcher = watcher
+        return watcher
+
+    def build(self, force: bool = False, jobs: int = 1, mode: str = "scan",
+              readers: int = 4, embed_workers: int = 2, embed_batch: int = 256, queue_size: int = 64, job=None):
+        """Index the tree.
+
+        mode="scan" walks every file; mode="git" only looks at paths git reports
+        as changed since the last indexed commit (falling back to a scan when
+        there is no usable recorded commit).
+
+        Work streams through walk → read → chunk → embed → write stages joined by
+        bounded queues of `queue_size`. `readers`, `jobs` (chunk processes) and
+        `embed_workers` set each stage's concurrency; the embed stage packs up to
+        `embed_batch` chunks from several files into one embedding call. Walk and
+        write are single-threaded.
+
+        `job` is an optional BuildJob: it reports live progress, and cancelling it
+        stops the build after keeping the files already written.
+        """
+        with self._index_guard():
+            if job is not None and job.cancel_event.is_set():
+                raise BuildCancelled("build cancelled")
+            # Other processes may have built (or died mid-build) since this one started.
+            self.state = self._load_state()
+            self._build(force, jobs, mode, readers, embed_workers, embed_batch, queue_size, job)
+
+    def _build(self, force, jobs, mode, readers, embed_workers, embed_batch, queue_size, job):
+        jobs = jobs or os.cpu_count() or 1
+        print(f"🔍 Building index for {self.root}" + (f" ({jobs} jobs)" if jobs > 1 else ""))
+        self.unchanged_by_hash = 0
+        self.chunk_stats = {"new": 0, "unchanged": 0, "deleted": 0}
+        self.skip_stats = Counter()
+        hits, misses = self.embedder.hits, self.embedder.misses
+        requests, retries = self.embedder.requests, self.embedder.retries
+        self.ignore = IgnoreRules(self.root)
+        head = self._git_head()
+        changed_paths = None
+        if mode == "git" and not force and head and self.state.get("git_head"):
+            changed_paths = self._git_changes(self.state["git_head"])
+        seen, deleted = set(), []
+        if changed_paths is not None:
+            print(f"   git: {len(changed_paths)} paths changed since {self.state['git_head'][:12]}")
+            walk = lambda: self._diff_files(changed_paths, deleted)
+        else:
+            if mode == "git":
+                print("   git: no usable indexed commit, scanning the whole tree")
+            walk = lambda: self._scan_files(force, seen)
+
+        if self.state.get("build_in_progress"):
+            self._reconcile()
+        self.state["build_in_progress"] = True
+        self._save_state()
+        self.last_checkpoint = time.monotonic()
+        self.hot_pending = set()
+        self.index_usable = self.collection.count() > 0
+        self.current_job = job
+        self.updated = 0
+        pool = None
+        if jobs > 1:
+            # Workers start from a clean forkserver, not a fork of this threaded process.
+            import multiprocessing
+            pool = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("forkserver"))
+        try:
+            pipeline = BuildPipeline(queue_size)
+            to_read, to_chunk, to_embed, to_write = (pipeline.queue() for _ in range(4))
+            pipeline.stage("walk", walk, outbox=to_read)
+            pipeline.stage("read", self._read_stage, readers, to_read, to_chunk)
+            pipeline.stage("chunk", lambda item: self._chunk_stage(item, pool), jobs, to_chunk, to_embed)
+            pipeline.stage("embed", self._embed_stage, embed_workers, to_embed, to_write,
+                           batch_weight=lambda item: len(item[2]), batch_limit=embed_batch)
+            pipeline.stage("write", self._write_stage, 1, to_write)
+            if job is not None:
+                job.attach(pipeline, self.chunk_stats)
+            pipeline.run()
+        except BuildCancelled:
+            self._checkpoint()
+            print(f"🛑 Build cancelled after {self.updated} files")
+            raise
+        except Exception:
+            self._checkpoint()
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        self.writer.flush()
+        self._mark_usable()
+        self.current_job = None
+
+        if changed_paths is None:
+            deleted = sorted(set(self.metadata) - seen)
+        for rel_path in deleted:
+            self._remove_file(rel_path)
+        self._save_metadata()
+        if head:
+            self.state["git_head"] = head
+        self.state.pop("build_in_progress", None)
+        self._save_state()
+        self.last_build_stats = pipeline.stats()
+        print(f"✅ Index ready! {self.updated} files updated • {len(deleted)} removed • {self.collection.count()} chunks")
+        print(f"   chunks: {self.chunk_stats['new']} embedded • {self.chunk_stats['unchanged']} unchanged"
+              f" • {self.chunk_stats['deleted']} deleted")
+        print(f"   embedding cache: {self.embedder.hits - hits} hits • {self.embedder.misses - misses} misses")
+        if self.embedder.requests != requests:
+            throttled = f" • throttled {self.embedder.budget.waited:.1f}s" if self.embedder.budget else ""
+            print(f"   openai: {self.embedder.requests - requests} requests"
+                  f" • {self.embedder.retries - retries} retries{throttled}")
+        if self.unchanged_by_hash:
+            print(f"   {self.unchanged_by_hash} touched files skipped (content unchanged)")
+        if self.skip_stats:
+            print("   not indexed: " + " • ".join(f"{n} {reason}" for reason, n in self.skip_stats.most_common()))
+        for st in self.last_build_stats if self.updated or self.skip_stats else []:
+            print(f"   {st['stage']:<5} x{st['workers']:<2} {st['items']:>7} items • {st['items_per_s']:>8}/s"
+                  f" • busy {st['busy_s']:.1f}s • queue max {st['queue_max']} avg {st['queue_avg']}")
+
+    def _hot_done(self, rel_path: str):
+        if rel_path in self.hot_pending:
+            self.hot_pending.discard(rel_path)
+            if not self.hot_pending:
+                self.writer.flush()
+                self._mark_usable()
+
+    def _read_stage(self, file_path: Path):
+        file_path, rel_path, lang_id = self._chunk_job(file_path)
+        result = self._read_file(file_path, rel_path)
+        if result is None:
+            # Unreadable: still pass through to the write stage, which alone touches the writer.
+            return [(rel_path, lang_id, None, None)]
+        state, content = result
+        return [(rel_path, lang_id, state, content)]
+
+    def _chunk_stage(self, item, pool):
+        rel_path, lang_id, state, content = item
+        if content is None:
+            records = []
+        elif pool is not None:
+            records = pool.submit(_chunk_content_worker, (rel_path, lang_id, content, self.chunker)).result()
+        else:
+            parser, query = self._parser(lang_id)
+            records = self._chunk_content(content, rel_path, lang_id, parser, self.chunker, query)
+        return [(rel_path, state, records)]
+
+    def _embed_stage(self, items):
+        diffs = [self._diff_chunks(rel_path, records) if state is not None else ([],)
+                 for rel_path, state, records in items]
+        texts = [r["text"] for diff in diffs for r in diff[0]]
+        vectors = iter(self.embedder.embed(texts) if texts else [])
+        outputs = []
+        for (rel_path, state, _), diff in zip(items, diffs):
+            embeddings = [next(vectors) for _ in diff[0]]
+            outputs.append((rel_path, state, diff, embeddings))
+        return outputs
+
+    def _write_stage(self, item):
+        rel_path, state, diff, embeddings = item
+        if state is None:
+            self._hot_done(rel_path)
+            return
+        self._write_chunks(rel_path, diff, embeddings)
+        self.metadata[rel_path] = {**state, "last_indexed": datetime.now().isoformat()}
+        self._hot_done(rel_path)
+        if "skipped" in state:
+            self.skip_stats[state["skipped"]] += 1
+            return
+        self.updated += 1
+        if self.updated % 30 == 0:
+            print(f"   Processed {self.updated} files...")
+        if time.monotonic() - self.last_checkpoint >= self.checkpoint_seconds:
+            self._checkpoint()
 
     def _should_index(self, file_path: Path, force: bool) -> bool:
+        """Stat fast path first; only hash the file when mtime or size moved."""
         if force:
             return True
         rel = str(file_path.relative_to(self.root))
-        last_mtime = self.metadata.get(rel, {}).get("mtime")
-        return not last_mtime or file_path.stat().st_mtime > last_mtime
+        entry = self.metadata.get(rel)
+        if not entry:
+            return True
+        st = file_path.stat()
+        if "hash" not in entry:
+            return st.st_mtime > entry.get("mtime", 0)
+        if st.st_mtime == entry["mtime"] and st.st_size == entry["size"]:
+            return False
+        if st.st_size != entry["size"]:
+            return True
+        try:
+            if hash_file(file_path) != entry["hash"]:
+                return True
+        except OSError:
+            return True
+        self.metadata[rel] = {**entry, "mtime": st.st_mtime}
+        self.unchanged_by_hash += 1
+        return False
+
+    def _chunk_job(self, file_path: Path):
+        lang_id = self.EXT_TO_LANG.get(file_path.suffix.lower())
+        if lang_id and self._parser(lang_id)[0] is None:
+            lang_id = None
+        return file_path, str(file_path.relative_to(self.root)), lang_id
 
     def _index_file(self, file_path: Path):
-        suffix = file_path.suffix.lower()
-        lang_id = self.EXT_TO_LANG.get(suffix)
-        rel_path = str(file_path.relative_to(self.root))
-        try:
-            content = file_path.read_text(encoding="utf-8", errors="ignore")
-        except:
+        file_path, rel_path, lang_id = self._chunk_job(file_path)
+        result = self._chunk_file(file_path, rel_path, lang_id)
+        self._apply_chunks(rel_path, result)
+
+    def _remove_file(self, rel_path: str):
+        if rel_path in self.writer.pending_files:
+            self.writer.flush()
+        self.collection.delete(where={"file": rel_path})
+        self.metadata.pop(rel_path, None)
+        self.parse_cache.discard(rel_path)
+
+    def _apply_chunks(self, rel_path: str, result):
+        if result is None:
             return
+        state, records = result
+        self._store_chunks(rel_path, records)
+        self.metadata[rel_path] = {**state, "last_indexed": datetime.now().isoformat()}
 
-        if lang_id and lang_id in self.parsers:
-            self._structured_chunk(file_path, content, lang_id, rel_path)
-        else:
-            self._fallback_chunk(file_path, content, rel_path)
+    def _read_file(self, file_path: Path, rel_path: str):
+        """Returns None if unreadable, else (state, content) where state holds the
+        mtime/size/hash recorded in metadata.
 
-        self.metadata[rel_path] = {
-            "mtime": file_path.stat().st_mtime,
-            "last_indexed": datetime.now().isoformat()
-        }
+        Files rejected by the FileFilter come back with content None and the
+        reason under state["skipped"]; only their first few KB are read.
+        """
+        try:
+            st = file_path.stat()
+            state = {"mtime": st.st_mtime, "size": st.st_size, "hash": None}
+            reason = self.file_filter.skip_by_name(rel_path, st.st_size)
+            if reason:
+                return {**state, "skipped": reason}, None
+            with open(file_path, "rb") as f:
+                head = f.read(FileFilter.SNIFF_BYTES)
+                reason = self.file_filter.skip_by_head(head)
+                if reason:
+                    return {**state, "skipped": reason}, None
+                data = head + f.read()
+        except:
+            return None
+        state["hash"] = file_digest(data)
+        content = data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+        return state, content
 
-    def _structured_chunk(self, file_path: Path, content: str, lang_id: str, rel_path: str):
-        parser = self.parsers[lang_id]
-        tree = parser.parse(bytes(content, "utf-8"))
-        chunks = self._ast_extract_chunks(tree, content)
-        if not chunks:
-            return self._fallback_chunk(file_path, content, rel_path)
-        texts = [c["text"] for c in chunks]
-        embeddings = self.embedder.embed(texts)
-        for i, chunk in enumerate(chunks):
-            doc_id = f"{rel_path}:{i}"
-            self.collection.add(
-                documents=[chunk["text"]],
-                metadatas=[{
-                    "file": rel_path,
-                    "symbol": chunk.get("symbol"),
-                    "kind": chunk.get("kind"),
-                    "language": lang_id,
-                    "start_line": chunk.get("start_line")
-                }],
-                ids=[doc_id],
-                embeddings=[embeddings[i]]
-            )
+    def _chunk_file(self, file_path: Path, rel_path: str, lang_id):
+        """Read and chunk one file. Returns None if unreadable, else (state, records)."""
+        result = self._read_file(file_path, rel_path)
+        if result is None:
+            return None
+        state, content = result
+        if content is None:
+            return state, []
+        parser, query = self._parser(lang_id)
+        return state, self._chunk_content(content, rel_path, lang_id, parser, self.chunker, query, self.parse_cache)
 
-    def _ast_extract_chunks(self, tree, content: str):
-        chunks = []
-        def walk(node):
-            if any(kw in node.type for kw in [
-                "function", "method", "class", "struct", "enum", "trait", "impl",
-                "interface", "record", "namespace"
-            ]):
-                start = node.start_byte
-                end = node.end_byte
-                text = content[start:end].strip()
-                if len(text) > 50:
-                    name_node = node.child_by_field_name("name") or node.child_by_field_name("identifier")
-                    symbol = name_node.text.decode("utf-8") if name_node else None
-                    chunks.append({
-                        "text": text,
-                        "symbol": symbol,
-                        "kind": node.type,
-                        "start_line": node.start_point[0] + 1
+    @staticmethod
+    def _chunk_content(content: str, rel_path: str, lang_id, parser, chunker, query=None, parse_cache=None):
+        if parser is not None:
+            src = bytes(content, "utf-8")
+            tree = parse_cache.parse(rel_path, lang_id, parser, src) if parse_cache else parser.parse(src)
+            chunks = chunker.extract(tree, content, query)
+            if chunks:
+                records = []
+                for chunk in chunks:
+                    metadata = {
+                        "file": rel_path,
+                        "symbol": chunk.get("symbol"),
+                        "symbol_path": chunk["symbol_path"],
+                        "kind": chunk.get("kind"),
+                        "language": lang_id,
+                        "start_line": chunk.get("start_line"),
+                        "end_line": chunk.get("end_line"),
+                        "part": chunk.get("part"),
+                        "parent": chunk.get("parent"),
+                        "skeleton": chunk.get("skeleton")
+                    }
+                    records.append({
+                        "id": chunk_id(rel_path, lang_id, chunk["symbol_path"], chunk["text"]),
+                        "text": chunk["text"],
+                        "metadata": {k: v for k, v in metadata.items() if v is not None}
                     })
-            for child in node.children:
-                walk(child)
-        walk(tree.root_node)
-        return chunks
+                return CodebaseContextOracle._dedupe_ids(records)
+        return CodebaseContextOracle._dedupe_ids(
+            CodebaseContextOracle._fallback_chunks(content, rel_path, chunker.max_tokens)
+        )
+
+    @staticmethod
+    def _dedupe_ids(records):
+        """Suffix repeated IDs (identical text under the same symbol path) with an occurrence number."""
+        seen = {}
+        for record in records:
+            n = seen.get(record["id"], 0)
+            seen[record["id"]] = n + 1
+            if n:
+                record["id"] = f"{record['id']}#{n}"
+        return records
+
+    def _diff_chunks(self, rel_path: str, records):
+        """Compare a file's new chunks with what is stored.
+
+        Returns (fresh, moved, stale, unchanged): records with new IDs, records
+        whose content is unchanged but whose metadata moved, vanished IDs, and
+        the number of chunks kept as-is.
+        """
+        existing = self.collection.get(where={"file": rel_path}, include=["metadatas"])
+        old = dict(zip(existing["ids"], existing["metadatas"]))
+        new_ids = {r["id"] for r in records}
+        stale = [i for i in old if i not in new_ids]
+        fresh = [r for r in records if r["id"] not in old]
+        moved = [r for r in records if r["id"] in old and old[r["id"]] != r["metadata"]]
+        return fresh, moved, stale, len(records) - len(fresh)
 
-    def _fallback_chunk(self, file_path: Path, content: str, rel_path: str, chunk_size=700):
+    def _write_chunks(self, rel_path: str, diff, embeddings):
+        fresh, moved, stale, unchanged = diff
+        if stale:
+            self.writer.delete(stale, rel_path)
+        for record in moved:
+            self.writer.update_metadata(record)
+        for record, embedding in zip(fresh, embeddings):
+            self.writer.add(record, embedding)
+        self.chunk_stats["new"] += len(fresh)
+        self.chunk_stats["unchanged"] += unchanged
+        self.chunk_stats["deleted"] += len(stale)
+
+    def _store_chunks(self, rel_path: str, records):
+        """Diff the file's new chunks against what is stored: embed only new IDs, delete vanished ones."""
+        if rel_path in self.writer.pending_files:
+            self.writer.flush()
+        diff = self._diff_chunks(rel_path, records)
+        texts = [r["text"] for r in diff[0]]
+        self._write_chunks(rel_path, diff, self.embedder.embed(texts) if texts else [])
+
+    @staticmethod
+    def _fallback_chunks(content: str, rel_path: str, max_tokens: int = 800, overlap_lines: int = 8):
+        """Line windows of at most `max_tokens` (a single longer line stays whole), overlapping by a few lines."""
+        records = []
         lines = content.splitlines()
-        for i in range(0, len(lines), chunk_size - 80):
-            chunk = "\n".join(lines[i:i + chunk_size])
-            if len(chunk.strip()) < 60:
-                continue
-            doc_id = f"{rel_path}:fb_{i}"
-            self.collection.add(
-                documents=[chunk],
-                metadatas=[{"file": rel_path, "kind": "fallback"}],
-                ids=[doc_id]
-            )
+        sizes = [len(line.encode("utf-8")) + 1 for line in lines]
+        i = 0
+        while i < len(lines):
+            j, size = i + 1, sizes[i]
+            while j < len(lines) and ASTChunker.tokens(size + sizes[j]) <= max_tokens:
+                size += sizes[j]
+                j += 1
+            chunk = "\n".join(lines[i:j])
+            if len(chunk.strip()) >= 60:
+                records.append({
+                    "id": chunk_id(rel_path, "text", "fallback", chunk),
+                    "text": chunk,
+                    "metadata": {"file": rel_path, "kind": "fallback", "start_line": i + 1, "end_line": j}
+                })
+            if j >= len(lines):
+                break
+            i = max(j - overlap_lines, i + 1)
+        return records
 
     def query(self, natural_language_query: str, k: int = 8):
         results = self.collection.query(
-            query_texts=[natural_language_query],
+            query_embeddings=[self.embedder.embed_query(natural_language_query)],
             n_results=min(k, 20),
             include=["documents", "metadatas"]
         )
@@ -223,11 +2692,38 @@ class CodebaseContextOracle:
             "status": "ready",
             "root": str(self.root),
             "total_chunks": self.collection.count(),
-            "supported_languages": sorted(set(self.EXT_TO_LANG.values()))
+            "supported_languages": sorted(set(self.EXT_TO_LANG.values())),
+            "index_usable": self.index_usable,
+            "startup_s": self.startup_times,
+            "lazy_load_s": {"embedder": self.embedder.load_seconds, "parsers": self.parser_load_times},
+            "last_build_stages": self.last_build_stats,
+            "watching": self.watcher is not None,
+            "watch_stats": self.watcher.stats if self.watcher else None,
+            "reparses": {"incremental": self.parse_cache.incremental, "full": self.parse_cache.full},
+            "query_cache": self.embedder.query_cache_stats()
         }
 
+    def prewarm_queries(self, n: int = 100):
+        """Embed the `n` most frequent past queries from project memory into the query cache.
+
+        Does nothing while memory is empty, so a fresh server doesn't load the model just to prewarm.
+        """
+        started = time.perf_counter()
+        try:
+            queries = self.memory.frequent_queries(n)
+            if not queries:
+                return 0
+            warmed = self.embedder.prewarm_queries(["project overview and decisions", *queries])
+        except Exception as e:
+            print(f"⚠️ Query prewarm failed: {e}")
+            return 0
+        print(f"🔥 Prewarmed {warmed} query embeddings in {time.perf_counter() - started:.2f}s")
+        return warmed
+
     def symbol_usages(self, symbol: str):
-        results = self.collection.query(query_texts=[symbol], n_results=15, include=["metadatas"])
+        results = self.collection.query(
+            query_embeddings=[self.embedder.embed_query(symbol)], n_results=15, include=["metadatas"]
+        )
         return {
             "symbol": symbol,
             "found_in_files": sorted({m["file"] for m in results["metadatas"][0]})
@@ -239,8 +2735,63 @@ class CodebaseContextOracle:
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("command", choices=["build"], nargs="?", default="build")
+    parser.add_argument("command", choices=["build", "watch", "sidecar"], nargs="?", default="build")
     parser.add_argument("--force", action="store_true")
+    parser.add_argument("--mode", choices=["scan", "git"], default="scan",
+                        help="git: only reindex paths changed since the last indexed commit")
+    parser.add_argument("--jobs", type=int, default=1, help="parse/chunk worker processes (0 = all cores)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="chunks per vector-store write")
+    parser.add_argument("--max-file-bytes", type=int, default=2_000_000, help="skip files larger than this")
+    parser.add_argument("--skip-glob", action="append", default=[], help="extra glob of files to skip (repeatable)")
+    parser.add_argument("--chunk-tokens", type=int, default=800, help="target maximum tokens per code chunk")
+    parser.add_argument("--min-chunk-tokens", type=int, default=100,
+                        help="definitions smaller than this are packed with adjacent siblings")
+    parser.add_argument("--flat-chunks", action="store_true",
+                        help="chunk every definition whole instead of class skeletons + members")
+    parser.add_argument("--readers", type=int, default=4, help="file reader threads")
+    parser.add_argument("--embed-workers", type=int, default=2, help="concurrent embedding batches")
+    parser.add_argument("--embed-batch", type=int, default=256, help="chunks per embedding call")
+    parser.add_argument("--queue-size", type=int, default=64, help="bound on each inter-stage queue")
+    parser.add_argument("--checkpoint-seconds", type=float, default=60.0,
+                        help="save build progress at most this often so an interrupted build resumes")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="OpenAI embedding requests in flight")
+    parser.add_argument("--embed-tpm", type=int, default=None,
+                        help="OpenAI tokens-per-minute limit to throttle embedding requests to")
+    parser.add_argument("--local-backend", choices=["torch", "onnx"], default="torch",
+                        help="local embedding runtime when OPENAI_API_KEY is unset (onnx: int8-quantized, CPU)")
+    parser.add_argument("--local-threads", type=int, default=0, help="local embedder intra-op threads (0 = runtime default)")
+    parser.add_argument("--local-batch-size", type=int, default=64, help="texts per local embedding batch")
+    parser.add_argument("--on-model-mismatch", choices=["refuse", "migrate"], default="refuse",
+                        help="what to do when the index was embedded with a different model")
+    parser.add_argument("--debounce", type=float, default=0.5,
+                        help="watch: seconds of quiet before changed files are reindexed")
+    parser.add_argument("--embed-socket", default=None,
+                        help="Unix socket of a shared embedding sidecar (sidecar: the socket to serve on)")
+    parser.add_argument("--sidecar-max-batch", type=int, default=256, help="sidecar: most texts per merged batch")
+    parser.add_argument("--sidecar-max-wait-ms", type=float, default=5.0,
+                        help="sidecar: how long to wait for more requests before running a batch")
     args = parser.parse_args()
-    oracle = CodebaseContextOracle()
-    oracle.build(force=args.force)
+    if args.command == "sidecar":
+        if not args.embed_socket:
+            parser.error("sidecar needs --embed-socket")
+        embedder = Embedder(max_in_flight=args.embed_concurrency, tokens_per_minute=args.embed_tpm,
+                            local_backend=args.local_backend, local_threads=args.local_threads,
+                            local_batch_size=args.local_batch_size)
+        EmbeddingSidecar(embedder, args.embed_socket, args.sidecar_max_batch, args.sidecar_max_wait_ms).serve_forever()
+        sys.exit(0)
+    oracle = CodebaseContextOracle(
+        write_batch_size=args.batch_size, max_file_bytes=args.max_file_bytes, skip_globs=args.skip_glob,
+        chunk_tokens=args.chunk_tokens, min_chunk_tokens=args.min_chunk_tokens,
+        hierarchical_chunks=not args.flat_chunks, checkpoint_seconds=args.checkpoint_seconds,
+        embed_concurrency=args.embed_concurrency, embed_tpm=args.embed_tpm,
+        local_backend=args.local_backend, local_threads=args.local_threads, local_batch_size=args.local_batch_size,
+        on_model_mismatch=args.on_model_mismatch, embed_socket=args.embed_socket
+    )
+    oracle.build(force=args.force, jobs=args.jobs, mode=args.mode, readers=args.readers,
+                 embed_workers=args.embed_workers, embed_batch=args.embed_batch, queue_size=args.queue_size)
+    if args.command == "watch" and oracle.watch(args.debounce):
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            oracle.watcher.stop()
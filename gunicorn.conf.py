@@ -0,0 +1,37 @@
+"""
+Gunicorn hooks - starts the shared embedding sidecar before any worker.
+
+When ORACLE_EMBED_SOCKET is set, the master spawns one
+`codebase_context_oracle.py sidecar` process on that socket, so every worker
+embeds through a single model copy instead of loading its own.
+"""
+import os
+import sys
+import subprocess
+
+sidecar = None
+
+def on_starting(server):
+    global sidecar
+    socket_path = os.getenv("ORACLE_EMBED_SOCKET")
+    if not socket_path:
+        return
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "codebase_context_oracle.py"),
+           "sidecar", "--embed-socket", socket_path]
+    for env, flag in (("ORACLE_EMBED_CONCURRENCY", "--embed-concurrency"), ("ORACLE_EMBED_TPM", "--embed-tpm"),
+                      ("ORACLE_LOCAL_BACKEND", "--local-backend"), ("ORACLE_LOCAL_THREADS", "--local-threads"),
+                      ("ORACLE_LOCAL_BATCH_SIZE", "--local-batch-size"),
+                      ("ORACLE_SIDECAR_MAX_BATCH", "--sidecar-max-batch"),
+                      ("ORACLE_SIDECAR_MAX_WAIT_MS", "--sidecar-max-wait-ms")):
+        if os.getenv(env):
+            cmd += [flag, os.environ[env]]
+    sidecar = subprocess.Popen(cmd)
+    server.log.info("Started embedding sidecar (pid %s) on %s", sidecar.pid, socket_path)
+
+def on_exit(server):
+    if sidecar and sidecar.poll() is None:
+        sidecar.terminate()
+        try:
+            sidecar.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            sidecar.kill()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Lightweight Oracle client - talks to a running oracle_server over HTTP.
+
+Standard library only, so status checks, queries and build triggers from
+shells, editors and git hooks start in milliseconds. Building or watching
+locally still goes through codebase_context_oracle.py.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.error
+import urllib.request
+
+ORACLE_URL = os.getenv("ORACLE_URL", "http://localhost:8000")
+
+def call(method: str, path: str, body=None, timeout: float = 30.0):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(
+        ORACLE_URL.rstrip("/") + path, data=data, method=method,
+        headers={"Content-Type": "application/json"} if data else {}
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read() or b"null")
+    except urllib.error.HTTPError as e:
+        detail = e.read().decode("utf-8", errors="replace")
+        sys.exit(f"❌ {method} {path} → {e.code}: {detail}")
+    except urllib.error.URLError as e:
+        sys.exit(f"❌ Oracle not reachable at {ORACLE_URL}: {e.reason}")
+
+def wait_for(job_id: str, interval: float = 2.0):
+    while True:
+        job = call("GET", f"/build/{job_id}")
+        eta = f" • ETA {job['eta_s']}s" if job.get("eta_s") is not None else ""
+        print(f"   {job['status']}: {job['files_done']}/{job['files_total']} files"
+              f" • {job['chunks_per_s']} chunks/s{eta}", file=sys.stderr)
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query a running CodebaseContextOracle server")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="health and index overview")
+    q = sub.add_parser("query", help="natural-language code search")
+    q.add_argument("text")
+    q.add_argument("-k", type=int, default=8)
+    u = sub.add_parser("usages", help="files that use a symbol")
+    u.add_argument("symbol")
+    m = sub.add_parser("memory", help="recent project memory")
+    m.add_argument("-k", type=int, default=10)
+    b = sub.add_parser("build", help="start (or join) a build on the server")
+    b.add_argument("--force", action="store_true")
+    b.add_argument("--mode", choices=["scan", "git"], default="scan")
+    b.add_argument("--wait", action="store_true", help="poll until the build finishes")
+    j = sub.add_parser("job", help="progress of a build job")
+    j.add_argument("job_id")
+    c = sub.add_parser("cancel", help="cancel a build job")
+    c.add_argument("job_id")
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        result = call("GET", "/overview")
+    elif args.command == "query":
+        result = call("POST", "/query", {"natural_language_query": args.text, "k": args.k}, timeout=120)
+    elif args.command == "usages":
+        result = call("POST", "/symbol/usages", {"symbol": args.symbol})
+    elif args.command == "memory":
+        result = call("GET", f"/memory/project_state?k={args.k}")
+    elif args.command == "build":
+        result = call("POST", "/build", {"force": args.force, "mode": args.mode})
+        if args.wait:
+            result = wait_for(result["job_id"])
+    elif args.command == "job":
+        result = call("GET", f"/build/{args.job_id}")
+    else:
+        result = call("DELETE", f"/build/{args.job_id}")
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -3,29 +3,56 @@
 CodebaseContextOracle FastAPI Server - Memory-Aware
 """
 import os
+import threading
+from typing import Literal
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 
-from codebase_context_oracle import CodebaseContextOracle
+from codebase_context_oracle import CodebaseContextOracle, BuildJobManager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global oracle
+    global oracle, build_jobs
     root = os.getenv("ORACLE_ROOT_DIR", ".")
     print(f"🚀 Starting Oracle at root: {root}")
-    oracle = CodebaseContextOracle(root)
+    oracle = CodebaseContextOracle(
+        root, write_batch_size=int(os.getenv("ORACLE_WRITE_BATCH_SIZE", "1000")),
+        max_file_bytes=int(os.getenv("ORACLE_MAX_FILE_BYTES", "2000000")),
+        skip_globs=[g.strip() for g in os.getenv("ORACLE_SKIP_GLOBS", "").split(",") if g.strip()],
+        chunk_tokens=int(os.getenv("ORACLE_CHUNK_TOKENS", "800")),
+        min_chunk_tokens=int(os.getenv("ORACLE_MIN_CHUNK_TOKENS", "100")),
+        hierarchical_chunks=os.getenv("ORACLE_FLAT_CHUNKS", "") not in ("1", "true"),
+        checkpoint_seconds=float(os.getenv("ORACLE_CHECKPOINT_SECONDS", "60")),
+        embed_concurrency=int(os.getenv("ORACLE_EMBED_CONCURRENCY", "4")),
+        embed_tpm=int(os.getenv("ORACLE_EMBED_TPM", "0")) or None,
+        local_backend=os.getenv("ORACLE_LOCAL_BACKEND", "torch"),
+        local_threads=int(os.getenv("ORACLE_LOCAL_THREADS", "0")),
+        local_batch_size=int(os.getenv("ORACLE_LOCAL_BATCH_SIZE", "64")),
+        on_model_mismatch=os.getenv("ORACLE_ON_MODEL_MISMATCH", "refuse"),
+        query_cache_size=int(os.getenv("ORACLE_QUERY_CACHE_SIZE", "1024")),
+        embed_socket=os.getenv("ORACLE_EMBED_SOCKET") or None
+    )
+    build_jobs = BuildJobManager(oracle)
     total = oracle.collection.count()
-    print(f"✅ Index ready — {total} chunks | Memory ready")
+    print(f"✅ Index ready — {total} chunks | Memory ready | startup {oracle.startup_times['total']}s")
+    prewarm = int(os.getenv("ORACLE_PREWARM_QUERIES", "100"))
+    if prewarm:
+        threading.Thread(target=oracle.prewarm_queries, args=(prewarm,), name="oracle-prewarm", daemon=True).start()
+    if os.getenv("ORACLE_WATCH", "") in ("1", "true"):
+        oracle.watch(float(os.getenv("ORACLE_WATCH_DEBOUNCE", "0.5")))
     yield
+    if oracle.watcher:
+        oracle.watcher.stop()
     print("🛑 Oracle shutting down")
 
 app = FastAPI(title="CodebaseContextOracle", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
 oracle: CodebaseContextOracle = None
+build_jobs: BuildJobManager = None
 
 class QueryRequest(BaseModel):
     natural_language_query: str
@@ -33,6 +60,12 @@ class QueryRequest(BaseModel):
 
 class BuildRequest(BaseModel):
     force: bool = False
+    jobs: int = 1
+    mode: Literal["scan", "git"] = "scan"
+    readers: int = 4
+    embed_workers: int = 2
+    embed_batch: int = 256
+    queue_size: int = 64
 
 class SymbolRequest(BaseModel):
     symbol: str
@@ -56,11 +89,24 @@ async def symbol_usages(request: SymbolRequest):
     return oracle.symbol_usages(request.symbol)
 
 @app.post("/build")
-async def build(request: BuildRequest, background_tasks: BackgroundTasks):
-    def do_build():
-        oracle.build(force=request.force)
-    background_tasks.add_task(do_build)
-    return {"status": "started", "message": "Indexing in background"}
+async def build(request: BuildRequest):
+    job, coalesced = build_jobs.submit(**request.model_dump())
+    return {"status": job["status"], "job_id": job["id"], "coalesced": coalesced,
+            "message": "Joined an identical build" if coalesced else "Indexing in background"}
+
+@app.get("/build/{job_id}")
+async def build_status(job_id: str):
+    job = build_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Unknown build job {job_id}")
+    return job
+
+@app.delete("/build/{job_id}")
+async def cancel_build(job_id: str):
+    job = build_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(404, f"Unknown build job {job_id}")
+    return job
 
 @app.get("/memory/project_state")
 async def project_state(k: int = Query(10, ge=1, le=50)):
@@ -4,7 +4,7 @@ mkdir -p .git/hooks
 cat > .git/hooks/post-commit << 'EOF'
 #!/bin/bash
 echo "🔄 Oracle: incremental reindex after commit"
-curl -s -X POST http://localhost:8000/build -H "Content-Type: application/json" -d '{"force": false}' > /dev/null || true
+curl -s -X POST http://localhost:8000/build -H "Content-Type: application/json" -d '{"force": false, "mode": "git"}' > /dev/null || true
 echo "✅ Oracle updated"
 EOF
 